@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+# Batch driver shared by the steganography tools: runs one task per carrier
+# on a process pool and streams one JSON line per carrier as each finishes.
+# The same pool spreads a sharded payload over, and gathers it back from,
+# a set of carriers.
+
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import partial
+
+import payload
+
+def iter_sources(source):
+    """Yield the carrier paths named by source.
+
+    A directory yields the files directly inside it in sorted order. Any
+    other path is read as a manifest: one carrier path per line, blank
+    lines and lines starting with '#' skipped, relative paths taken from
+    the manifest's directory.
+    """
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            path = os.path.join(source, name)
+            if os.path.isfile(path):
+                yield path
+        return
+
+    base = os.path.dirname(source)
+    with open(source) as manifest:
+        for line in manifest:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield os.path.join(base, line)
+
+@contextlib.contextmanager
+def phase(timings, name):
+    """Add the wall time spent inside the block to timings[name]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(timings.get(name, 0) + time.perf_counter() - start, 6)
+
+def run_task(task, path):
+    """Run task(path, timings) and wrap its result, or its error, in a report dict."""
+    timings = {}
+    start = time.perf_counter()
+    try:
+        report = {'input': path, 'ok': True, **task(path, timings)}
+    except Exception as e:  # Any failure is reported for its carrier alone and the batch goes on
+        report = {'input': path, 'ok': False, 'error': str(e)}
+    timings['total'] = round(time.perf_counter() - start, 6)
+    report['timings'] = timings
+    return report
+
+def map_unordered(func, items, jobs):
+    """Apply func to items on a pool of `jobs` processes, yielding results as they finish.
+
+    At most 2 * jobs items are in flight at once, so one worker is always
+    decoding or encoding its next carrier while the others compute, and a
+    slow carrier never holds back the reports of the ones after it.
+    """
+    if jobs <= 1:
+        yield from map(func, items)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = set()
+        for item in items:
+            pending.add(pool.submit(func, item))
+            if len(pending) >= 2 * jobs:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+def unique_outputs(paths, clashes):
+    """Yield the paths whose output name no earlier path took, appending a failed report to clashes for the rest."""
+    taken = {}
+    for path in paths:
+        name = output_name(path)
+        if name in taken:
+            clashes.append({'input': path, 'ok': False, 'error': f"Output name {name} is already taken by {taken[name]}",
+                            'timings': {'total': 0.0}})
+        else:
+            taken[name] = path
+            yield path
+
+def run_batch(task, source, jobs, output_dir=None, out=sys.stdout):
+    """Run task over every carrier in source, writing one JSON line per carrier.
+
+    task(path, timings) returns a dict of results and records its phases
+    with phase(). When results are written to output_dir, a carrier whose
+    output name an earlier one took fails instead of overwriting it.
+    Returns the number of carriers that failed.
+    """
+    clashes = []
+    paths = iter_sources(source) if output_dir is None else unique_outputs(iter_sources(source), clashes)
+    failures = 0
+    for report in map_unordered(partial(run_task, task), paths, jobs):
+        failures += not report['ok']
+        out.write(json.dumps(report) + '\n')
+        out.flush()
+    for report in clashes:  # Complete once every path has been handed out
+        failures += 1
+        out.write(json.dumps(report) + '\n')
+    out.flush()
+    return failures
+
+def add_batch_arguments(parser):
+    """Add the source and pool options every tool's batch subcommand shares."""
+    parser.add_argument("action", choices=["hide", "extract"], help="Operation to run on every carrier")
+    parser.add_argument("source", help="Directory of carriers, or a manifest file listing one path per line")
+    parser.add_argument("message", nargs="?", help="Message to hide in every carrier")
+    parser.add_argument("--file", help="Hide the contents of this file instead of a message")
+    parser.add_argument("--output-dir", help="Directory for the stego carriers (hide) or extracted payloads (extract)")
+    parser.add_argument("--format", choices=["auto", "framed", "text"], default="auto",
+                        help="framed: length-prefixed payload with a checksum; text: null-terminated "
+                             "message as in earlier versions; auto (default): framed when hiding, and "
+                             "when extracting whichever format each carrier holds")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (default: number of CPUs)")
+
+def prepare_batch(parser, args):
+    """Check the batch arguments and create the output directory.
+
+    Returns what hide embeds: a str message for the text format, bytes for
+    the framed one, or None for extract.
+    """
+    if not os.path.exists(args.source):
+        parser.error(f"{args.source} does not exist")
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+    if args.action == "extract":
+        return None
+    if (args.message is None) == (args.file is None):
+        parser.error("batch hide needs either a message or --file")
+    if args.output_dir is None:
+        parser.error("batch hide needs --output-dir")
+    if args.format == "text":
+        if args.file is not None:
+            parser.error("--file needs the framed format")
+        return args.message
+    if args.file is not None:
+        with open(args.file, 'rb') as f:
+            return f.read()
+    return args.message.encode('utf-8')
+
+def output_name(path):
+    """Return the name the results for carrier path are written under: its whole file name.
+
+    The source extension stays, so scan.png and scan.bmp do not share an
+    output.
+    """
+    return os.path.basename(path)
+
+def output_path(output_dir, path, extension):
+    """Return where the result for carrier path goes: its output name in output_dir, extension appended."""
+    return os.path.join(output_dir, output_name(path) + extension)
+
+def extraction_report(path, data, text_format, output_dir, timings):
+    """Return the report fields for an extracted payload, writing it to output_dir if one is given."""
+    report = {'size': len(data),
+              'message': data.decode('latin-1') if text_format else data.decode('utf-8', errors='replace')}
+    if output_dir is not None:
+        report['output'] = output_path(output_dir, path, '.bin')
+        with phase(timings, 'write'), open(report['output'], 'wb') as f:
+            f.write(data)
+    return report
+
+def add_shard_arguments(shard_parser, unshard_parser):
+    """Add the options of the shard and unshard subcommands."""
+    shard_parser.add_argument("output_dir", help="Directory for the stego carriers")
+    shard_parser.add_argument("carriers", nargs="+", help="Carrier images, filled in the order given")
+    source = shard_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--file", help="File to split across the carriers")
+    source.add_argument("--message", help="Message to split across the carriers")
+
+    unshard_parser.add_argument("carriers", nargs="+", help="Stego carriers holding the shards, in any order")
+    unshard_parser.add_argument("--output", help="Write the reassembled payload to this file")
+
+    for parser in (shard_parser, unshard_parser):
+        parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                            help="Worker processes (default: number of CPUs)")
+
+def shard_data(args):
+    """Return the bytes the shard subcommand splits."""
+    if args.file is not None:
+        with open(args.file, 'rb') as f:
+            return f.read()
+    return args.message.encode('utf-8')
+
+def hide_shards(data, carriers, capacity, hide_task, jobs):
+    """Split data over carriers and hide each shard, yielding hide_task's results as they finish.
+
+    capacity(path) gives a carrier's room for a framed payload, and
+    hide_task((path, shard)) hides one shard. Raises ValueError, before
+    anything is hidden, if two carriers share an output name, since one
+    shard would overwrite the other.
+    """
+    taken = {}
+    for path in carriers:
+        name = output_name(path)
+        if name in taken:
+            raise ValueError(f"Output name {name} is already taken by {taken[name]}")
+        taken[name] = path
+    shards = payload.split_shards(data, [capacity(path) for path in carriers])
+    work = [(path, shard) for path, shard in zip(carriers, shards) if shard is not None]
+    return map_unordered(hide_task, work, jobs)
+
+def extract_shards(carriers, extract_task, jobs):
+    """Extract a shard from every carrier with extract_task(path) and reassemble the payload."""
+    return payload.join_shards(map_unordered(extract_task, carriers, jobs))
+
+def report_unshard(data, output):
+    """Write or print a reassembled payload."""
+    if output:
+        with open(output, 'wb') as f:
+            f.write(data)
+        print(f"Reassembled {len(data)} bytes to {output}")
+    else:
+        print(f"Extracted message: {data.decode('utf-8', errors='replace')}")
+
+def iter_paths(paths):
+    """Yield the given file paths, expanding directories to the files inside them."""
+    for path in paths:
+        if os.path.isdir(path):
+            yield from iter_sources(path)
+        else:
+            yield path
+
+def report_capacities(paths, capacity):
+    """Print the framed payload room capacity(path) of each carrier.
+
+    Returns the number of carriers that could not be read.
+    """
+    failures = 0
+    for path in iter_paths(paths):
+        try:
+            room = capacity(path)
+            print(f"{path}: {room} bytes" if room >= 0 else f"{path}: - (too small for a framed payload)")
+        except Exception as e:  # Reported for its carrier alone, as run_task does
+            print(f"{path}: Error: {e}")
+            failures += 1
+    return failures
@@ -0,0 +1,632 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import random
+import struct
+import tempfile
+import time
+import tracemalloc
+
+from PIL import Image
+
+import bitbuffer
+import compression
+import custom_7th
+import custom_diagonals
+import payload
+import pixelplans
+import solver
+
+MB = 1024 * 1024
+
+# Reference implementations: the original byte-at-a-time loops, kept here so the
+# bulk engines can be checked against them for both output and speed.
+def reference_rle_encode(data):
+    compressed_data = bytearray()
+    i = 0
+    while i < len(data):
+        count = 1
+        while i + 1 < len(data) and data[i] == data[i + 1] and count < 255:
+            i += 1
+            count += 1
+        compressed_data.append(data[i])
+        compressed_data.append(count)
+        i += 1
+    return bytes(compressed_data)
+
+def reference_rle_decode(data):
+    decompressed_data = bytearray()
+    i = 0
+    while i < len(data):
+        char = data[i]
+        count = data[i + 1]
+        decompressed_data.extend([char] * count)
+        i += 2
+    return bytes(decompressed_data)
+
+def reference_hide_7th(image, message):
+    pixels = image.load()
+    message_binary = ''.join(format(ord(char), '08b') for char in message) + '00000000'
+    width, height = image.size
+    pixel_count = 0
+    binary_index = 0
+    for y in range(height):
+        for x in range(width):
+            if pixel_count % 7 == 0 and binary_index < len(message_binary):
+                r, g, b = pixels[x, y]
+                pixels[x, y] = ((r & ~1) | int(message_binary[binary_index]), g, b)
+                binary_index += 1
+            pixel_count += 1
+    return image
+
+def reference_extract_7th(image):
+    pixels = image.load()
+    width, height = image.size
+    pixel_count = 0
+    message_binary = ''
+    for y in range(height):
+        for x in range(width):
+            if pixel_count % 7 == 0:
+                message_binary += str(pixels[x, y][0] & 1)
+            pixel_count += 1
+    message = ''
+    for i in range(0, len(message_binary), 8):
+        byte = message_binary[i:i + 8]
+        if byte == '00000000':
+            break
+        message += chr(int(byte, 2))
+    return message
+
+def reference_extract_solver(image_data):
+    binary_message = []
+    for byte in image_data:
+        binary_message.append(str(byte & 1))  # Get the LSB
+        if len(binary_message) % 8 == 0 and ''.join(binary_message[-8:]) == "00000000":
+            break
+    return ''.join(
+        chr(int(''.join(binary_message[i:i+8]), 2))
+        for i in range(0, len(binary_message) - 8, 8)
+    )
+
+def reference_groups(data, count):
+    """The '0'/'1' string path from payload bytes to one carrier group per byte."""
+    bits = format(int.from_bytes(data, 'big'), f'0{len(data) * 8}b').encode('ascii')
+    bits = bits.translate(bytes.maketrans(b'01', b'\x00\x01'))
+    if count == 1:
+        return bits
+    groups = -(-len(bits) // count)
+    bits += bytes(groups * count - len(bits))
+    merged = 0
+    for j in range(count):
+        merged |= int.from_bytes(bits[j::count], 'big') << (count - 1 - j)
+    return merged.to_bytes(groups, 'big')
+
+def reference_ungroup(values, count):
+    """The '0'/'1' string path from carrier bytes holding `count` bits each back to bytes."""
+    bits = bytearray(len(values) * count)
+    for j in range(count):
+        bits[j::count] = values.translate(bytes(ord('0') + ((v >> (count - 1 - j)) & 1) for v in range(256)))
+    whole = len(bits) // 8 * 8
+    return int(bits[:whole], 2).to_bytes(whole // 8, 'big')
+
+def make_corpora(size):
+    """Build sample inputs resembling the data the tools are used on."""
+    rng = random.Random(1234)
+    words = [b'error', b'kernel', b'disk', b'0x7fff', b'sector', b'user', b'login', b'\n']
+    text = bytearray()
+    while len(text) < size:
+        text += b' '.join(rng.choice(words) for _ in range(12)) + b'\n'
+
+    disk = bytearray()
+    while len(disk) < size:
+        disk += bytes(rng.randrange(4096, 65536))  # Long zero-filled stretches
+        disk += rng.randbytes(rng.randrange(512, 8192))
+
+    hex_dump = bytearray()
+    while len(hex_dump) < size:
+        hex_dump += rng.randbytes(16).hex(' ').encode() + b'\n'
+
+    return {
+        'zeros': bytes(size),
+        'random': rng.randbytes(size),
+        'text': bytes(text[:size]),
+        'disk image': bytes(disk[:size]),
+        'hex dump': bytes(hex_dump[:size]),
+    }
+
+def throughput(func, data, repeat=1):
+    """Return (result, MB/s) for func(data), using the best of `repeat` runs."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, len(data) / MB / max(best, 1e-9)
+
+def bench_compression(size):
+    print(f"RLE throughput on {size / MB:.1f} MB inputs (MB/s of raw data)")
+    print(f"{'corpus':<12} {'loop enc':>10} {'bulk enc':>10} {'loop dec':>10} {'bulk dec':>10}")
+    for name, data in make_corpora(size).items():
+        expected, loop_enc = throughput(reference_rle_encode, data)
+        encoded, bulk_enc = throughput(compression.rle_encode, data, repeat=3)
+        if encoded != expected:
+            raise AssertionError(f"Encoded output differs from the reference on '{name}'")
+
+        _, loop_dec = throughput(lambda _: reference_rle_decode(encoded), data)
+        decoded, bulk_dec = throughput(lambda _: compression.rle_decode(encoded), data, repeat=3)
+        if decoded != data:
+            raise AssertionError(f"Round trip failed on '{name}'")
+
+        print(f"{name:<12} {loop_enc:>10.1f} {bulk_enc:>10.1f} {loop_dec:>10.1f} {bulk_dec:>10.1f}")
+
+def bench_codecs(size):
+    """Compare the framed-format block codecs by ratio and speed on each corpus."""
+    print(f"Block codecs on {size / MB:.1f} MB inputs (ratio = compressed / raw, MB/s of raw data)")
+    print(f"{'corpus':<12} {'codec':<10} {'ratio':>7} {'encode':>10} {'decode':>10}")
+    for name, data in make_corpora(size).items():
+        for codec, (codec_name, encode, decode) in compression.CODECS.items():
+            encoded, enc = throughput(encode, data)
+            decoded, dec = throughput(lambda _: decode(encoded), data)
+            if decoded != data:
+                raise AssertionError(f"Round trip failed for {codec_name} on '{name}'")
+            print(f"{name:<12} {codec_name:<10} {len(encoded) / len(data):>7.3f} {enc:>10.1f} {dec:>10.1f}")
+
+        for prefer in ('speed', 'ratio'):
+            blocks = [data[i:i + compression.CHUNK_SIZE] for i in range(0, len(data), compression.CHUNK_SIZE)]
+            frames, enc = throughput(
+                lambda _: [compression.compress_block(block, None, prefer) for block in blocks], data)
+            decoded, dec = throughput(
+                lambda _: b''.join(compression.decompress_block((codec, payload, raw_size, crc))
+                                   for codec, raw_size, crc, payload in frames), data)
+            if decoded != data:
+                raise AssertionError(f"Round trip failed for auto/{prefer} on '{name}'")
+            chosen = sorted({compression.CODECS[frame[0]][0] for frame in frames})
+            ratio = sum(len(frame[3]) for frame in frames) / len(data)
+            print(f"{name:<12} {'auto/' + prefer:<10} {ratio:>7.3f} {enc:>10.1f} {dec:>10.1f}  ({', '.join(chosen)})")
+
+def bench_lzss(size):
+    """Show the LZSS speed/ratio trade-off across effort levels."""
+    print(f"LZSS effort levels on {size / MB:.1f} MB inputs (ratio = compressed / raw, MB/s of raw data)")
+    print(f"{'corpus':<12} {'level':>5} {'ratio':>7} {'encode':>10} {'decode':>10}")
+    corpora = make_corpora(size)
+    for name in ('text', 'hex dump', 'disk image'):
+        data = corpora[name]
+        for level in range(1, 10):
+            encoded, enc = throughput(lambda _: compression.lzss_encode(data, level), data)
+            decoded, dec = throughput(lambda _: compression.lzss_decode(encoded), data)
+            if decoded != data:
+                raise AssertionError(f"Round trip failed at level {level} on '{name}'")
+            print(f"{name:<12} {level:>5} {len(encoded) / len(data):>7.3f} {enc:>10.2f} {dec:>10.1f}")
+
+def bench_parallel(size):
+    """Time framed compression and decompression per job count.
+
+    The text corpus is used because it is the most CPU-bound for RLE, so the
+    cost of shipping blocks to the workers is small next to the work itself.
+    """
+    data = make_corpora(size)['text']
+    job_counts = sorted({1, 2, 4, os.cpu_count() or 1})
+    print(f"Framed RLE on {size / MB:.1f} MB, {os.cpu_count()} CPUs available (MB/s of raw data)")
+    print(f"{'jobs':>4} {'compress':>10} {'speedup':>8} {'decompress':>11} {'speedup':>8}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_path = os.path.join(tmp, 'input.bin')
+        packed_path = os.path.join(tmp, 'input.rlef')
+        out_path = os.path.join(tmp, 'output.bin')
+        with open(raw_path, 'wb') as f:
+            f.write(data)
+
+        base = None
+        for jobs in job_counts:
+            start = time.perf_counter()
+            compression.compress_file(raw_path, packed_path, framed=True, jobs=jobs)
+            enc = size / MB / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            compression.decompress_file(packed_path, out_path, jobs=jobs)
+            dec = size / MB / (time.perf_counter() - start)
+
+            with open(out_path, 'rb') as f:
+                if f.read() != data:
+                    raise AssertionError(f"Round trip failed with {jobs} jobs")
+
+            base = base or (enc, dec)
+            print(f"{jobs:>4} {enc:>10.1f} {enc / base[0]:>7.2f}x {dec:>11.1f} {dec / base[1]:>7.2f}x")
+
+def bench_seventh(megapixels):
+    """Time the per-pixel and bulk every-7th-pixel engines on in-memory images.
+
+    The message fills the image, which is the worst case for both engines;
+    file decoding and encoding are left out so only the engines are compared.
+    The last column extracts a 10-byte message, which should not depend on
+    the image size.
+    """
+    print("Every-7th-pixel red LSB engine (seconds per image)")
+    print(f"{'MP':>4} {'loop hide':>10} {'bulk hide':>10} {'loop extract':>13} {'bulk extract':>13} {'10 B extract':>13}")
+    rng = random.Random(1234)
+    for mp in megapixels:
+        width = 4000
+        height = int(mp * 1_000_000) // width
+        image = Image.frombytes('RGB', (width, height), rng.randbytes(width * height * 3))
+        capacity = (width * height + 6) // 7 // 8 - 1
+        message = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz ') for _ in range(capacity))
+
+        start = time.perf_counter()
+        expected = reference_hide_7th(image.copy(), message)
+        loop_hide = time.perf_counter() - start
+        start = time.perf_counter()
+        hidden = custom_7th.embed_message(image, message)
+        bulk_hide = time.perf_counter() - start
+        if hidden.tobytes() != expected.tobytes():
+            raise AssertionError(f"Hidden image differs from the reference at {mp} MP")
+
+        start = time.perf_counter()
+        reference = reference_extract_7th(hidden)
+        loop_extract = time.perf_counter() - start
+        start = time.perf_counter()
+        extracted = custom_7th.extract_message(hidden)
+        bulk_extract = time.perf_counter() - start
+        if extracted != reference or extracted != message:
+            raise AssertionError(f"Extracted message differs from the reference at {mp} MP")
+
+        hidden = custom_7th.embed_message(image, message[:10])
+        start = time.perf_counter()
+        extracted = custom_7th.extract_message(hidden)
+        short_extract = time.perf_counter() - start
+        if extracted != message[:10]:
+            raise AssertionError(f"Short message round trip failed at {mp} MP")
+
+        print(f"{mp:>4g} {loop_hide:>10.2f} {bulk_hide:>10.3f} {loop_extract:>13.2f} {bulk_extract:>13.3f}"
+              f" {short_extract:>13.5f}")
+
+def bench_density(megapixels):
+    """Fill images with framed payloads under several layouts and time hiding and extracting them.
+
+    Rates are payload megabytes per second, so denser layouts are credited
+    for the extra data they carry rather than for the pixels they touch.
+    """
+    layouts = [custom_7th.Layout(7, 'R', 1), custom_7th.Layout(1, 'R', 1), custom_7th.Layout(1, 'RGB', 1),
+               custom_7th.Layout(3, 'RGB', 2), custom_7th.Layout(1, 'RGB', 2), custom_7th.Layout(1, 'RGBA', 4)]
+    print("custom_7th layouts filled with a framed payload (MB/s of payload)")
+    print(f"{'MP':>4} {'stride':>6} {'channels':>8} {'bits':>4} {'capacity MB':>12} {'hide':>8} {'extract':>8}")
+    rng = random.Random(1234)
+    for mp in megapixels:
+        width = 4000
+        height = int(mp * 1_000_000) // width
+        noise = rng.randbytes(width * height * 4)
+        for layout in layouts:
+            mode = custom_7th.layout_mode(layout)
+            image = Image.frombytes(mode, (width, height), noise)
+            data = rng.randbytes(custom_7th.payload_capacity(image.size, layout))
+
+            start = time.perf_counter()
+            hidden = custom_7th.embed_payload(image, data, layout)
+            hide = len(data) / MB / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            extracted = custom_7th.extract_payload(hidden, layout)
+            extract = len(data) / MB / (time.perf_counter() - start)
+            if extracted != data:
+                raise AssertionError(f"Round trip failed with {layout} at {mp} MP")
+
+            print(f"{mp:>4g} {layout.stride:>6} {layout.channels:>8} {layout.bits:>4} "
+                  f"{len(data) / MB:>12.2f} {hide:>8.1f} {extract:>8.1f}")
+
+def bench_diagonal(megapixels):
+    """Fill images with framed payloads along every custom_diagonals scheme and time hiding and extracting.
+
+    The plan column is the time to build a scheme's pixel order, which is
+    cached, so only the first image of a given size pays it.
+    """
+    print("custom_diagonals schemes filled with a framed payload")
+    print(f"{'MP':>4} {'scheme':>8} {'capacity MB':>12} {'plan s':>8} {'hide MB/s':>10} {'extract MB/s':>13}")
+    rng = random.Random(1234)
+    for mp in megapixels:
+        width = 4000
+        height = int(mp * 1_000_000) // width
+        image = Image.frombytes('RGB', (width, height), rng.randbytes(width * height * 3))
+        for scheme in pixelplans.SCHEMES:
+            data = rng.randbytes(custom_diagonals.payload_capacity(width, height, scheme))
+
+            pixelplans.index_plan.cache_clear()
+            start = time.perf_counter()
+            pixelplans.index_plan(width, height, scheme)
+            plan = time.perf_counter() - start
+
+            start = time.perf_counter()
+            hidden = custom_diagonals.hide_payload_diagonal(image, data, width, height, scheme)
+            hide = len(data) / MB / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            extracted = custom_diagonals.extract_payload_diagonal(hidden, width, height, scheme)
+            extract = len(data) / MB / (time.perf_counter() - start)
+            if extracted != data:
+                raise AssertionError(f"Round trip failed with {scheme} at {mp} MP")
+
+            print(f"{mp:>4g} {scheme:>8} {len(data) / MB:>12.4f} {plan:>8.4f} {hide:>10.2f} {extract:>13.2f}")
+
+def bench_keyed(megapixels, size):
+    """Hide and extract a framed payload of `size` bytes in raster order and in keyed order.
+
+    The order column is the time to derive the keyed order, which is
+    cached per image size and key and included in the keyed hide time.
+    """
+    print(f"{size / MB:g} MB framed payload, raster vs keyed pixel order (seconds)")
+    print(f"{'MP':>4} {'layout':>8} {'order':>7} {'raster hide':>12} {'keyed hide':>11} "
+          f"{'raster extract':>15} {'keyed extract':>14}")
+    rng = random.Random(1234)
+    data = rng.randbytes(size)
+    for mp in megapixels:
+        width = 4000
+        height = int(mp * 1_000_000) // width
+        image = Image.frombytes('RGB', (width, height), rng.randbytes(width * height * 3))
+        for layout in (custom_7th.Layout(1, 'R', 1), custom_7th.Layout(3, 'RGB', 1)):
+            keyed = layout._replace(key='benchmark')
+            if len(data) > custom_7th.payload_capacity(image.size, keyed):
+                continue
+            times = []
+            for current in (layout, keyed):
+                custom_7th.keyed_order.cache_clear()
+                start = time.perf_counter()
+                hidden = custom_7th.embed_payload(image, data, current)
+                times.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                if custom_7th.extract_payload(hidden, current) != data:
+                    raise AssertionError(f"Round trip failed with {current} at {mp} MP")
+                times.append(time.perf_counter() - start)
+            custom_7th.keyed_order.cache_clear()
+            start = time.perf_counter()
+            custom_7th.keyed_order_for(image.size, keyed)
+            order = time.perf_counter() - start
+
+            name = f"{layout.stride}:{layout.channels}:{layout.bits}"
+            print(f"{mp:>4g} {name:>8} {order:>7.3f} {times[0]:>12.3f} {times[2]:>11.3f} "
+                  f"{times[1]:>15.3f} {times[3]:>14.3f}")
+
+def bench_partial(megapixels):
+    """Time extracting a short framed payload from carrier files, decoding all rows or only the first.
+
+    The full column decodes the whole image before extracting, as
+    extraction did before carriers were read in strips.
+    """
+    print("10-byte framed payload extracted from a carrier file (seconds)")
+    print(f"{'MP':>4} {'format':>6} {'full decode':>12} {'partial':>9} {'speedup':>8}")
+    rng = random.Random(1234)
+    with tempfile.TemporaryDirectory() as tmp:
+        for mp in megapixels:
+            width = 4000
+            height = int(mp * 1_000_000) // width
+            image = Image.frombytes('RGB', (width, height), rng.randbytes(width * height * 3))
+            data = rng.randbytes(10)
+            hidden = custom_7th.embed_payload(image, data)
+            for fmt in ('png', 'bmp'):
+                path = os.path.join(tmp, f'carrier.{fmt}')
+                hidden.save(path)
+
+                start = time.perf_counter()
+                full_data = custom_7th.extract_payload(custom_7th.open_image(path))
+                full = time.perf_counter() - start
+                start = time.perf_counter()
+                partial_data = custom_7th.extract_payload_from_image(path)
+                partial = time.perf_counter() - start
+                if full_data != data or partial_data != data:
+                    raise AssertionError(f"Round trip failed for {fmt} at {mp} MP")
+
+                print(f"{mp:>4g} {fmt:>6} {full:>12.3f} {partial:>9.4f} {full / partial:>7.0f}x")
+
+def write_sparse_bmp(path, width, height):
+    """Write a 24-bit BMP of the given size whose pixel bytes are a sparse hole of zeros."""
+    stride = (width * 3 + 3) // 4 * 4
+    offset = 54
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<2sIHHI', b'BM', offset + stride * height, 0, 0, offset))
+        f.write(struct.pack('<IiiHHIIiiII', 40, width, height, 1, 24, 0, stride * height, 2835, 2835, 0, 0))
+        f.truncate(offset + stride * height)
+
+def bench_solver(megapixels):
+    """Hide a 4 KB framed payload in a BMP with the raw-byte solver, rewriting the file or editing it in place.
+
+    The rewrite column reads the whole carrier into memory and writes it
+    all back, as the solver did before it edited files through a memory map.
+    """
+    print("4 KB framed payload hidden in a 24-bit BMP carrier (seconds)")
+    print(f"{'MP':>4} {'file MB':>8} {'rewrite':>8} {'copy+map':>9} {'in place':>9} {'extract':>8}")
+    data = random.Random(1234).randbytes(4096)
+    with tempfile.TemporaryDirectory() as tmp:
+        carrier = os.path.join(tmp, 'carrier.bmp')
+        output = os.path.join(tmp, 'hidden.bmp')
+        for mp in megapixels:
+            width = 4000
+            write_sparse_bmp(carrier, width, int(mp * 1_000_000) // width)
+            region = solver.file_region(carrier)
+
+            start = time.perf_counter()
+            solver.write_image(output, solver.hide_payload(solver.read_image(carrier), data, region))
+            rewrite = time.perf_counter() - start
+            start = time.perf_counter()
+            solver.hide_in_file(carrier, output, data)
+            copied = time.perf_counter() - start
+            start = time.perf_counter()
+            solver.hide_in_file(carrier, carrier, data)
+            in_place = time.perf_counter() - start
+            start = time.perf_counter()
+            if solver.extract_from_file(carrier, solver.decode_payload) != data:
+                raise AssertionError(f"Round trip failed at {mp} MP")
+            extract = time.perf_counter() - start
+
+            size = os.path.getsize(carrier) / MB
+            print(f"{mp:>4g} {size:>8.0f} {rewrite:>8.3f} {copied:>9.3f} {in_place:>9.4f} {extract:>8.4f}")
+
+def make_carrier(kind, width, height, rng):
+    """Return a noise image of one carrier kind: a native mode, or 'P+t' for a palette with a transparent entry."""
+    mode = kind.split('+')[0]
+    if mode != 'P':
+        return Image.frombytes(mode, (width, height), rng.randbytes(width * height * len(mode)))
+    image = Image.frombytes('P', (width, height), bytes(b & 0x3F for b in rng.randbytes(width * height)))
+    image.putpalette(rng.randbytes(64 * 3))
+    if kind == 'P+t':
+        image.info['transparency'] = 0  # One index in 64 is see-through, so neighbouring indices differ in alpha
+    return image
+
+def bench_modes(megapixels):
+    """Fill carriers of every native mode with framed payloads through both image tools, saved as PNG.
+
+    Each round trip is checked, and so is the alpha of every pixel, which
+    must come out as it went in whatever the carrier mode.
+    """
+    print("Carrier modes filled with a framed payload and saved as PNG (seconds)")
+    print(f"{'MP':>4} {'mode':>5} {'tool':>10} {'output':>6} {'capacity KB':>12} {'hide':>8} {'extract':>8}")
+    rng = random.Random(1234)
+    with tempfile.TemporaryDirectory() as tmp:
+        carrier = os.path.join(tmp, 'carrier.png')
+        output = os.path.join(tmp, 'hidden.png')
+        for mp in megapixels:
+            width = 4000
+            height = int(mp * 1_000_000) // width
+            for kind in ('L', 'LA', 'P', 'P+t', 'RGB', 'RGBA'):
+                make_carrier(kind, width, height, rng).save(carrier)
+                with Image.open(carrier) as image:
+                    alpha = image.convert('RGBA').getchannel('A').tobytes()
+                for tool in ('custom_7th', 'diagonals'):
+                    if tool == 'custom_7th':
+                        data = rng.randbytes(custom_7th.payload_capacity((width, height)))
+                        start = time.perf_counter()
+                        custom_7th.embed_payload(custom_7th.open_image(carrier), data).save(output)
+                        hide = time.perf_counter() - start
+                        start = time.perf_counter()
+                        extracted = custom_7th.extract_payload(custom_7th.open_image(output))
+                    else:
+                        data = rng.randbytes(custom_diagonals.payload_capacity(width, height))
+                        start = time.perf_counter()
+                        img, _ = custom_diagonals.read_image(carrier)
+                        custom_diagonals.save_image(output, custom_diagonals.hide_payload_diagonal(img, data, width, height))
+                        hide = time.perf_counter() - start
+                        start = time.perf_counter()
+                        img, _ = custom_diagonals.read_image(output)
+                        extracted = custom_diagonals.extract_payload_diagonal(img, width, height)
+                    extract = time.perf_counter() - start
+                    if extracted != data:
+                        raise AssertionError(f"Round trip failed for {kind} with {tool} at {mp} MP")
+                    with Image.open(output) as hidden:
+                        mode = hidden.mode
+                        if hidden.convert('RGBA').getchannel('A').tobytes() != alpha:
+                            raise AssertionError(f"Alpha changed for {kind} with {tool} at {mp} MP")
+
+                    print(f"{mp:>4g} {kind:>5} {tool:>10} {mode:>6} {len(data) / 1024:>12.1f} "
+                          f"{hide:>8.3f} {extract:>8.3f}")
+
+def time_and_peak(func, *args):
+    """Return (result, seconds, peak MB allocated) for func(*args), timed without tracing."""
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / MB
+
+def bench_stream(size):
+    """Extract null-terminated messages with the raw-byte solver from a file twice the size they need.
+
+    The reference column is the original byte-at-a-time loop over the
+    whole file read into memory; whole-file decodes a file read into
+    memory with the bulk engine; streaming reads the file in chunks and
+    stops at the terminator.
+    """
+    print("Text message extracted by the raw-byte solver (seconds, peak MB allocated)")
+    print(f"{'message MB':>10} {'reference':>10} {'ref MB':>8} {'whole-file':>11} {'whole MB':>9} "
+          f"{'streaming':>10} {'stream MB':>10}")
+    rng = random.Random(1234)
+    with tempfile.TemporaryDirectory() as tmp:
+        carrier = os.path.join(tmp, 'carrier.bin')
+        for length in sorted({64 * 1024, MB, size}):
+            message = ''.join(rng.choices('abcdefghijklmnopqrstuvwxyz ', k=length))
+            with open(carrier, 'wb') as f:
+                f.write(os.urandom((length + 1) * 16))
+            solver.hide_in_file(carrier, carrier, message, carrier='raw')
+
+            if length <= MB:
+                reference, ref_time, ref_peak = time_and_peak(
+                    lambda: reference_extract_solver(solver.read_image(carrier)))
+                ref_cells = f"{ref_time:>10.3f} {ref_peak:>8.1f}"
+            else:
+                reference, ref_cells = message, f"{'-':>10} {'-':>8}"
+            whole, whole_time, whole_peak = time_and_peak(
+                lambda: solver.extract_message(solver.read_image(carrier)))
+            streamed, stream_time, stream_peak = time_and_peak(
+                solver.extract_from_file, carrier, solver.decode_message, 'raw')
+            if not reference == whole == streamed == message:
+                raise AssertionError(f"Round trip failed for a {length}-byte message")
+
+            print(f"{length / MB:>10g} {ref_cells} {whole_time:>11.3f} {whole_peak:>9.1f} "
+                  f"{stream_time:>10.3f} {stream_peak:>10.2f}")
+
+def bench_bits(size):
+    """Turn a payload of `size` bytes into carrier groups and back, through '0'/'1' strings and BitBuffers.
+
+    Groups are what the tools write into the low bits of carrier bytes, one
+    group of 1 to 4 bits per byte; peak is the memory allocated on the way.
+    """
+    print(f"{size / MB:g} MB payload to carrier groups and back (seconds, peak MB allocated)")
+    print(f"{'bits':>4} {'string in':>10} {'peak':>6} {'buffer in':>10} {'peak':>6} "
+          f"{'string out':>11} {'peak':>6} {'buffer out':>11} {'peak':>6}")
+    data = random.Random(1234).randbytes(size)
+    for count in range(1, payload.MAX_GROUP_BITS + 1):
+        groups, string_in, string_in_peak = time_and_peak(reference_groups, data, count)
+        buffer_groups, buffer_in, buffer_in_peak = time_and_peak(
+            lambda: bitbuffer.unpack(bitbuffer.from_bytes(data), count))
+        # Carrier bytes with random high bits, as gathered from an image
+        values = payload.embed_bits(random.Random(count).randbytes(len(groups)), groups, count)
+        unpacked, string_out, string_out_peak = time_and_peak(reference_ungroup, values, count)
+        packed, buffer_out, buffer_out_peak = time_and_peak(
+            lambda: bitbuffer.to_bytes(bitbuffer.bit_slice(bitbuffer.pack(values, count), 0, size * 8)))
+        if groups != buffer_groups or unpacked[:size] != data or packed != data:
+            raise AssertionError(f"Round trip failed with {count}-bit groups")
+
+        print(f"{count:>4} {string_in:>10.3f} {string_in_peak:>6.1f} {buffer_in:>10.3f} {buffer_in_peak:>6.1f} "
+              f"{string_out:>11.3f} {string_out_peak:>6.1f} {buffer_out:>11.3f} {buffer_out_peak:>6.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput benchmarks for the WOC tools")
+    parser.add_argument("suite", choices=["compression", "codecs", "lzss", "parallel", "seventh", "density",
+                                          "partial", "diagonal", "keyed", "solver", "stream", "bits", "modes"],
+                        help="Benchmark suite to run")
+    parser.add_argument("--size", type=float, default=4, help="Input size in MB (default: 4)")
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[1, 12, 48],
+                        help="Image sizes for the image suites (default: 1 12 48)")
+
+    args = parser.parse_args()
+    size = int(args.size * MB)
+
+    if args.suite == "compression":
+        bench_compression(size)
+    elif args.suite == "codecs":
+        bench_codecs(size)
+    elif args.suite == "lzss":
+        bench_lzss(size)
+    elif args.suite == "parallel":
+        bench_parallel(size)
+    elif args.suite == "seventh":
+        bench_seventh(args.megapixels)
+    elif args.suite == "density":
+        bench_density(args.megapixels)
+    elif args.suite == "partial":
+        bench_partial(args.megapixels)
+    elif args.suite == "diagonal":
+        bench_diagonal(args.megapixels)
+    elif args.suite == "keyed":
+        bench_keyed(args.megapixels, size)
+    elif args.suite == "solver":
+        bench_solver(args.megapixels)
+    elif args.suite == "stream":
+        bench_stream(size)
+    elif args.suite == "bits":
+        bench_bits(size)
+    elif args.suite == "modes":
+        bench_modes(args.megapixels)
+
+if __name__ == "__main__":
+    main()
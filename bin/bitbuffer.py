@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+# Compact bit buffers shared by the LSB steganography tools.
+#
+# A BitBuffer holds `length` bits packed eight to a byte in `data`, most
+# significant bit first, with any unused low bits of the last byte zero.
+# That is one bit of memory per bit, where a '0'/'1' string takes a byte.
+#
+# Carrier bytes hold one group of 1 to 4 bits each. Packing groups into a
+# buffer and unpacking them again works a lane at a time: groups and bytes
+# repeat with a short period, so lane j is a strided slice, translated
+# through a table and OR-ed into place as one big integer when a group
+# straddles two bytes. Every step runs in C.
+
+import math
+from collections import namedtuple
+
+from payload import MAX_GROUP_BITS
+
+BitBuffer = namedtuple('BitBuffer', 'data length')
+
+# How k-bit groups tile the bytes of a buffer: every `size` bytes hold
+# `groups` groups. group_parts[g] lists (byte, table) for the bytes group g
+# of a period overlaps, each table taking a byte to its share of the group;
+# byte_parts[b] lists (group, table) the other way round. A group of at
+# most 4 bits spans at most two bytes.
+Period = namedtuple('Period', 'size groups group_parts byte_parts')
+
+def group_period(count):
+    """Return the Period of `count`-bit groups."""
+    bits = count * 8 // math.gcd(count, 8)
+    group_parts = [[] for _ in range(bits // count)]
+    byte_parts = [[] for _ in range(bits // 8)]
+    for g in range(bits // count):
+        start, stop = g * count, (g + 1) * count
+        for b in range(start // 8, (stop - 1) // 8 + 1):
+            low, high = max(start, b * 8), min(stop, b * 8 + 8)  # The bits both cover
+            mask = (1 << (high - low)) - 1
+            to_byte, to_group = b * 8 + 8 - high, stop - high  # Shifts of those bits in each
+            group_parts[g].append((b, bytes((v >> to_byte & mask) << to_group for v in range(256))))
+            byte_parts[b].append((g, bytes((v >> to_group & mask) << to_byte for v in range(256))))
+    return Period(bits // 8, bits // count, group_parts, byte_parts)
+
+PERIODS = [None] + [group_period(count) for count in range(1, MAX_GROUP_BITS + 1)]
+
+def from_bytes(data):
+    """Return a BitBuffer holding the bits of data."""
+    return BitBuffer(bytes(data), len(data) * 8)
+
+def from_int(value, length):
+    """Return a BitBuffer holding the `length` low bits of value, high bit first."""
+    pad = -length % 8
+    return BitBuffer((value << pad).to_bytes((length + pad) // 8, 'big'), length)
+
+def from_text(text):
+    """Return a BitBuffer holding eight bits per character of text.
+
+    Characters above 255 take as many bits as they need, exactly as the
+    per-character '08b' format of earlier versions gave them.
+    """
+    try:
+        return from_bytes(text.encode('latin-1'))
+    except UnicodeEncodeError:
+        bits = ''.join(format(ord(char), '08b') for char in text)
+        return from_int(int(bits, 2), len(bits))
+
+def to_bytes(buffer):
+    """Return the bits of a buffer as bytes, the last byte padded with zero bits."""
+    return bytes(buffer.data)
+
+def to_int(buffer):
+    """Return the bits of a buffer as an integer, the first bit most significant."""
+    return int.from_bytes(buffer.data, 'big') >> (-buffer.length % 8)
+
+def to_string(buffer):
+    """Return the bits of a buffer as a '0'/'1' string, for display."""
+    return format(to_int(buffer), f'0{buffer.length}b') if buffer.length else ''
+
+def bit_slice(buffer, start, stop=None):
+    """Return the bits start to stop of a buffer, reading only the bytes they cover."""
+    stop = buffer.length if stop is None else min(stop, buffer.length)
+    start = min(start, stop)
+    first, last = start // 8, -(-stop // 8)
+    if start % 8 == 0:
+        data = bytearray(buffer.data[first:last])
+        if stop % 8:
+            data[-1] &= 0xFF << (8 - stop % 8) & 0xFF  # Clear the bits past stop
+        return BitBuffer(bytes(data), stop - start)
+    value = int.from_bytes(buffer.data[first:last], 'big') >> (last * 8 - stop)
+    return from_int(value & ((1 << (stop - start)) - 1), stop - start)
+
+def concat(first, second):
+    """Return the bits of first followed by the bits of second."""
+    if not first.length:
+        return second
+    if first.length % 8 == 0:
+        return BitBuffer(bytes(first.data) + bytes(second.data), first.length + second.length)
+    return from_int(to_int(first) << second.length | to_int(second), first.length + second.length)
+
+def merge(source, step, parts):
+    """OR together source[i::step].translate(table) for every (i, table) in parts, as one bytes object.
+
+    The tables of one group or byte set disjoint bits, so the big-integer
+    OR never carries between bytes. Lanes are sliced as they are needed,
+    so only one is held at a time.
+    """
+    if len(parts) == 1:
+        i, table = parts[0]
+        return source[i::step].translate(table)
+    merged = 0
+    for i, table in parts:
+        merged |= int.from_bytes(source[i::step].translate(table), 'big')
+    return merged.to_bytes(len(source) // step, 'big')
+
+def pack(values, count=1):
+    """Return a BitBuffer of the `count` low bits of every byte in values, high bit first."""
+    period = PERIODS[count]
+    length = len(values) * count
+    if len(values) % period.groups:
+        values = bytes(values) + bytes(-len(values) % period.groups)
+    data = bytearray(len(values) // period.groups * period.size)
+    for b, parts in enumerate(period.byte_parts):
+        data[b::period.size] = merge(values, period.groups, parts)
+    return BitBuffer(bytes(data[:-(-length // 8)]), length)
+
+def unpack(buffer, count=1):
+    """Return one byte per `count` bits of a buffer, holding the group, the last one padded with zeros."""
+    period = PERIODS[count]
+    data = buffer.data
+    if len(data) % period.size:
+        data = bytes(data) + bytes(-len(data) % period.size)
+    values = bytearray(len(data) // period.size * period.groups)
+    for g, parts in enumerate(period.group_parts):
+        values[g::period.groups] = merge(data, period.size, parts)
+    del values[-(-buffer.length // count):]
+    return values
+
+def iter_bytes(buffers):
+    """Yield the whole bytes of a stream of buffers, carrying bits split between two of them.
+
+    Bits left over at the end of the stream are dropped.
+    """
+    pending = BitBuffer(b'', 0)
+    for buffer in buffers:
+        buffer = concat(pending, buffer)
+        whole = buffer.length // 8 * 8
+        pending = bit_slice(buffer, whole)
+        yield bytes(buffer.data[:whole // 8])
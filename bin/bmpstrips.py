@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+# Strip-wise BMP reading, the BMP counterpart of pngstrips' reader.
+#
+# Uncompressed BMP rows sit at fixed offsets, so a band of rows is read with
+# one seek and handed to Pillow's raw decoder; rows outside the bands asked
+# for are never read. Bottom-up files (the usual kind) store the top rows
+# at the end of the file, which a band reads the same way, flipped.
+
+import struct
+
+from PIL import Image
+
+from rawcarriers import BI_RGB, FILE_HEADER_FORMAT, INFO_HEADER_FORMAT
+
+# (Pillow mode, raw mode) for the pixel depths handled in strips; 32-bit
+# BI_RGB pixels carry no alpha, matching how Pillow itself opens them
+RAW_MODES = {8: ('L', 'L'), 24: ('RGB', 'BGR'), 32: ('RGB', 'BGRX')}
+GRAY_PALETTE = b''.join(bytes((v, v, v, 0)) for v in range(256))
+
+def read_header(f):
+    """Read the headers of a BMP, returning ((width, height), mode, layout).
+
+    layout is (pixel data offset, row stride, bottom_up) for iter_bmp_strips.
+    Raises ValueError for anything but an uncompressed 24- or 32-bit BMP or
+    an 8-bit one with a grayscale palette, which the whole-image path still
+    handles.
+    """
+    header = f.read(struct.calcsize(FILE_HEADER_FORMAT) + struct.calcsize(INFO_HEADER_FORMAT))
+    if len(header) < struct.calcsize(FILE_HEADER_FORMAT) + struct.calcsize(INFO_HEADER_FORMAT):
+        raise ValueError("BMP header is corrupt!")
+    magic, _, _, _, offset = struct.unpack_from(FILE_HEADER_FORMAT, header)
+    info_size, width, height, _, depth, compression = struct.unpack_from(
+        INFO_HEADER_FORMAT, header, struct.calcsize(FILE_HEADER_FORMAT))
+    if magic != b'BM':
+        raise ValueError("Strip mode needs a PNG or BMP carrier!")
+    if info_size < 40 or compression != BI_RGB or depth not in RAW_MODES or width <= 0 or not height:
+        raise ValueError("Strip mode needs an uncompressed 24- or 32-bit or grayscale 8-bit BMP!")
+    if depth == 8:
+        f.seek(struct.calcsize(FILE_HEADER_FORMAT) + info_size)
+        if f.read(len(GRAY_PALETTE)) != GRAY_PALETTE:
+            raise ValueError("Strip mode needs an uncompressed 24- or 32-bit or grayscale 8-bit BMP!")
+    stride = (width * depth + 31) // 32 * 4  # Rows are padded to 4 bytes
+    return (width, abs(height)), RAW_MODES[depth], (offset, stride, height > 0)
+
+def iter_bmp_strips(f, size, modes, layout, rows, grow=False):
+    """Yield (top, band) for the BMP in f, `rows` rows at a time.
+
+    modes and layout come from read_header. With grow, rows doubles after
+    every band, so a reader that stops early touches few rows either way.
+    """
+    width, height = size
+    mode, raw_mode = modes
+    offset, stride, bottom_up = layout
+    top = 0
+    while top < height:
+        count = min(rows, height - top)
+        # Bottom-up files hold image row y at file row height - 1 - y
+        first = height - top - count if bottom_up else top
+        f.seek(offset + first * stride)
+        data = f.read(count * stride)
+        if len(data) < count * stride:
+            raise ValueError("BMP image data is truncated!")
+        yield top, Image.frombytes(mode, (width, count), data, 'raw', raw_mode, stride, -1 if bottom_up else 1)
+        top += count
+        if grow:
+            rows *= 2
+
+def read_strips(f, rows, grow=False):
+    """Read the headers of the BMP in f, returning ((width, height), mode, strips).
+
+    strips yields (top, band) as iter_bmp_strips does.
+    """
+    size, modes, layout = read_header(f)
+    return size, modes[0], iter_bmp_strips(f, size, modes, layout, rows, grow)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+# Capacity planner for the steganography tools: reports how many payload
+# bytes each carrier holds under every scheme, reading only image headers.
+#
+# Image.open is lazy and parses just the header for the size and mode, so
+# no pixels are decoded and thousands of carriers are sized per second.
+
+import argparse
+import json
+import sys
+
+from PIL import Image
+
+import batch
+import custom_7th
+import custom_diagonals
+import payload
+import solver
+
+# Only headers are read, so huge carriers are no decompression bomb here
+Image.MAX_IMAGE_PIXELS = None
+
+# custom_diagonals pixel orders: the main diagonal alone, and the ones covering every pixel (all the same size)
+DIAGONAL_SCHEMES = ('main', 'wrapped')
+
+# Multi-bit custom_7th layouts reported next to the default stride-7 one
+DENSE_LAYOUTS = [custom_7th.Layout(1, 'RGB', 1), custom_7th.Layout(1, 'RGB', 2), custom_7th.Layout(1, 'RGBA', 4)]
+
+def layout_name(layout):
+    """Return a layout as STRIDE:CHANNELS:BITS, the form --layout takes."""
+    return f"{layout.stride}:{layout.channels}:{layout.bits}"
+
+def parse_layout(value):
+    """argparse type for --layout: STRIDE:CHANNELS:BITS, e.g. 3:RG:2."""
+    try:
+        stride, channels, bits = value.split(':')
+        stride, bits = int(stride), int(bits)
+    except ValueError:
+        raise argparse.ArgumentTypeError("layout must look like STRIDE:CHANNELS:BITS") from None
+    if stride < 1 or not 1 <= bits <= payload.MAX_GROUP_BITS:
+        raise argparse.ArgumentTypeError("stride must be positive and bits between 1 and 4")
+    return custom_7th.Layout(stride, custom_7th.channel_set(channels), bits)
+
+def carrier_capacity(path, layouts):
+    """Return {scheme: framed payload bytes} for one carrier, reading only its header.
+
+    The image schemes are None when the file is not an image Pillow can
+    identify; the raw-byte solver scheme is None for compressed files. Any
+    scheme is None when the carrier is too small for a framed payload.
+    """
+    try:
+        capacities = {'solver': solver.file_capacity(path)}
+    except ValueError:
+        capacities = {'solver': None}
+    try:
+        with Image.open(path) as image:
+            size = image.size
+    except Image.UnidentifiedImageError:
+        size = None
+    for scheme in DIAGONAL_SCHEMES:
+        capacities[f'diagonal:{scheme}'] = custom_diagonals.payload_capacity(*size, scheme) if size else None
+    for layout in layouts:
+        capacities[layout_name(layout)] = custom_7th.payload_capacity(size, layout) if size else None
+    return {scheme: capacity if capacity is not None and capacity >= 0 else None
+            for scheme, capacity in capacities.items()}
+
+def plan(paths, layouts):
+    """Yield (path, capacities) for every carrier, with capacities None if the file cannot be read."""
+    for path in batch.iter_paths(paths):
+        try:
+            yield path, carrier_capacity(path, layouts)
+        except OSError:
+            yield path, None
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the payload capacity of carriers for every scheme")
+    parser.add_argument("carriers", nargs="+", help="Carrier files, or directories of them")
+    parser.add_argument("--layout", type=parse_layout, action="append", default=[],
+                        help="Also report a custom_7th layout given as STRIDE:CHANNELS:BITS (repeatable)")
+    parser.add_argument("--need", type=int, help="Only list carriers and schemes holding at least this many bytes")
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per carrier")
+    args = parser.parse_args()
+
+    layouts = [custom_7th.DEFAULT_LAYOUT, *DENSE_LAYOUTS, *args.layout]
+    schemes = ['solver', *(f'diagonal:{scheme}' for scheme in DIAGONAL_SCHEMES), *map(layout_name, layouts)]
+    if not args.json:
+        print('\t'.join(['carrier', *schemes]))
+
+    failures = 0
+    for path, capacities in plan(args.carriers, layouts):
+        if capacities is None:
+            failures += 1
+            print(json.dumps({'input': path, 'ok': False}) if args.json else f"{path}\tunreadable")
+            continue
+        if args.need is not None:
+            capacities = {scheme: capacity for scheme, capacity in capacities.items()
+                          if capacity is not None and capacity >= args.need}
+            if not capacities:
+                continue
+        if args.json:
+            print(json.dumps({'input': path, 'ok': True, 'capacity': capacities}))
+        else:
+            cells = [str(capacities[scheme]) if capacities.get(scheme) is not None else '-' for scheme in schemes]
+            print('\t'.join([path, *cells]))
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
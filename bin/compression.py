@@ -1,84 +1,982 @@
 #!/usr/bin/env python3
 
 import argparse
+import bz2
+import contextlib
+import heapq
+import lzma
+import math
 import os
+import re
+import struct
+import sys
+import zlib
+from bisect import bisect_right
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import accumulate, chain
+
+# Preflight: windows sampled across a file to estimate how well it compresses.
+# A file whose estimated ratio (order-0 entropy / 8 bits) reaches
+# INCOMPRESSIBLE_RATIO is stored rather than compressed.
+PREFLIGHT_WINDOWS = 8
+PREFLIGHT_WINDOW_SIZE = 64 * 1024
+INCOMPRESSIBLE_RATIO = 0.97
+
+def shannon_entropy(data):
+    """Return the order-0 Shannon entropy of data, in bits per byte."""
+    total = len(data)
+    return -sum(count / total * math.log2(count / total) for count in Counter(data).values())
+
+def preflight(file_path, windows=PREFLIGHT_WINDOWS, window_size=PREFLIGHT_WINDOW_SIZE):
+    """Estimate the compression ratio of a file from windows spread across it.
+
+    Each window's entropy is computed from its own byte histogram, so a file
+    mixing text and zero-filled areas is not mistaken for noise.  Returns
+    the estimated compressed / raw ratio.
+    """
+    size = os.path.getsize(file_path)
+    if size <= windows * window_size:
+        offsets, window_size = [0], size
+    else:
+        step = (size - window_size) // (windows - 1)
+        offsets = [i * step for i in range(windows)]
 
-def is_binary(file_path):
-    """Determine if a file is binary or text."""
     with open(file_path, 'rb') as file:
-        chunk = file.read(1024)  # Read a small portion
-    return b'\0' in chunk  # Binary files often contain null bytes
-
-def compress_file(input_path, output_path, binary_mode):
-    open_mode = 'rb' if binary_mode else 'r'
-    write_mode = 'wb' if binary_mode else 'w'
-
-    with open(input_path, open_mode) as f_in, open(output_path, write_mode) as f_out:
-        data = f_in.read()
-        if not binary_mode:
-            data = data.encode()  # Convert text to bytes for uniform processing
-
-        compressed_data = bytearray()
-        i = 0
-        while i < len(data):
-            count = 1
-            while i + 1 < len(data) and data[i] == data[i + 1] and count < 255:
-                i += 1
-                count += 1
-            compressed_data.append(data[i])
-            compressed_data.append(count)
-            i += 1
-
-        f_out.write(compressed_data)
-
-def decompress_file(input_path, output_path, binary_mode):
-    open_mode = 'rb' if binary_mode else 'r'
-    write_mode = 'wb' if binary_mode else 'w'
-
-    with open(input_path, open_mode) as f_in, open(output_path, write_mode) as f_out:
-        data = f_in.read()
-        if not binary_mode:
-            data = data.encode()  # Convert text to bytes for uniform processing
-
-        decompressed_data = bytearray()
-        i = 0
-        while i < len(data):
-            char = data[i]
-            count = data[i + 1]
-            decompressed_data.extend([char] * count)
-            i += 2
-
-        if not binary_mode:
-            decompressed_data = decompressed_data.decode()  # Convert bytes back to text
-        f_out.write(decompressed_data)
+        samples = []
+        for offset in offsets:
+            file.seek(offset)
+            samples.append(file.read(window_size))
+
+    sampled = sum(len(sample) for sample in samples)
+    if not sampled:
+        return 0.0
+    bits = sum(shannon_entropy(sample) * len(sample) for sample in samples if sample)
+    return bits / sampled / 8
+
+# Two identical bytes in a row mark the start of a run.  Whatever lies between
+# two runs is a stretch of single bytes, which can be emitted as (byte, 1) pairs
+# in bulk.
+RUN_START_PATTERN = re.compile(rb'(.)\1', re.DOTALL)
+
+# One pattern per byte value to find where a run ends.  A repeated literal is
+# scanned much faster by the regex engine than a back-reference.
+RUN_PATTERNS = [re.compile(re.escape(bytes((value,))) + b'+') for value in range(256)]
+
+# A stretch of (byte, 1) pairs, or one (byte, count) pair followed by repeats of
+# itself.  Every pair matches one of the two branches, so successive matches
+# tile the stream and always start on a pair boundary.
+PAIR_PATTERN = re.compile(rb'(?:.\x01)+|(.)(.)(?:\1\2)*', re.DOTALL)
+
+MAX_RUN = 255
+
+# Amount of input read, and the largest piece of output built, at a time.
+CHUNK_SIZE = 1024 * 1024
+
+# Framed format: FRAME_MAGIC and a version byte, then one frame per block made
+# of a (codec, compressed size, raw size, CRC-32 of the raw data) header and the
+# encoded block.  Blocks are encoded independently, each with its own codec, so
+# they can be compressed and decompressed in parallel.  A header of zeros ends
+# the frames; it is followed by the block index (one INDEX_ENTRY per block) and
+# a fixed-size trailer, so a seekable archive can be opened from its end and any
+# range of it decoded without touching the blocks before it.
+#
+# Older versions are still read.  Version 2 had one codec byte after the version
+# for the whole archive; version 1 had no codec byte, no checksums and no index.
+#
+# A legacy stream never holds a count of 0, so it can never start with FRAME_MAGIC.
+FRAME_MAGIC = b'R\x00LE'
+FRAME_VERSION = 3
+FRAME_HEADER_V1 = struct.Struct('<II')
+FRAME_HEADER_V2 = struct.Struct('<III')
+FRAME_HEADER = struct.Struct('<BIII')
+INDEX_ENTRY_V2 = struct.Struct('<QIII')  # Frame offset, compressed size, raw size, CRC-32
+INDEX_ENTRY = struct.Struct('<QBIII')  # Frame offset, codec, compressed size, raw size, CRC-32
+TRAILER = struct.Struct('<QQI4s')  # Index offset, original size, block count, FRAME_MAGIC
+
+CODEC_RLE = 0  # (byte, count) pairs, as in the legacy format
+CODEC_PACKBITS = 1  # Literal spans and repeat runs, see packbits_encode
+CODEC_STORE = 2  # The block as is
+CODEC_ZLIB = 3
+CODEC_BZ2 = 4
+CODEC_LZMA = 5
+CODEC_HUFFMAN = 6  # Canonical Huffman code, see huffman_encode
+CODEC_LZSS = 7  # Literal runs and back-references, see lzss_encode
+
+# Codecs whose encoder takes an effort level (1-9) as its second argument
+LEVELED_CODECS = {CODEC_ZLIB, CODEC_BZ2, CODEC_LZSS}
+
+# Codecs tried when picking one per block, cheapest first.  Preferring speed
+# takes the cheapest codec whose sample comes within SPEED_MARGIN (a fraction of
+# the sample size) of the smallest one; preferring ratio takes the smallest.
+SPEED_CODECS = (CODEC_STORE, CODEC_PACKBITS, CODEC_RLE, CODEC_ZLIB)
+RATIO_CODECS = SPEED_CODECS + (CODEC_HUFFMAN, CODEC_BZ2, CODEC_LZMA)
+SPEED_MARGIN = 0.05
+
+# Huffman codes are limited to HUFFMAN_MAX_BITS bits, so every code length fits
+# in a nibble and the decoder's lookup table, indexed by that many bits, stays
+# at 4096 entries.  A Huffman payload starts with the symbol count and the 256
+# code lengths packed two per byte.
+HUFFMAN_MAX_BITS = 12
+HUFFMAN_HEADER = struct.Struct('<I128s')
+HUFFMAN_SAMPLE_STRIDE = 16
+
+# LZSS back-references reach at most LZSS_WINDOW bytes back and are only used
+# from LZSS_MIN_MATCH bytes up, the shortest match that saves space.  The effort
+# level sets how many earlier positions with the same first bytes are tried.
+LZSS_MIN_MATCH = 4
+LZSS_MAX_MATCH = 64 * 1024
+LZSS_WINDOW = 0xFFFF
+LZSS_DEFAULT_LEVEL = 5
+
+# Blocks are sampled as a few windows spread over them, so that the trial
+# encodes stay cheap next to compressing the block itself.
+SAMPLE_WINDOWS = 4
+SAMPLE_WINDOW_SIZE = 16 * 1024
+
+# Three identical bytes in a row: the shortest run worth leaving a literal span
+# for in PackBits.
+PACKBITS_RUN_START_PATTERN = re.compile(rb'(.)\1\1', re.DOTALL)
+PACKBITS_MAX_SPAN = 128
+
+# A PackBits span followed by repeats of itself, used to expand a long run
+# split into full 128-byte repeat spans in one step.
+REPEATED_SPAN_PATTERN = re.compile(rb'(..)\1*', re.DOTALL)
+
+def encode_singles(data):
+    """Encode bytes known to contain no runs as (byte, 1) pairs."""
+    encoded = bytearray(2 * len(data))
+    encoded[0::2] = data
+    encoded[1::2] = b'\x01' * len(data)
+    return encoded
+
+def rle_encode(data):
+    """Run-length encode data into (byte, count) pairs, with count <= 255."""
+    pieces = []
+    append = pieces.append
+    search = RUN_START_PATTERN.search
+    pos = 0
+    match = search(data)
+    while match:
+        start = match.start()
+        if start > pos:
+            append(encode_singles(data[pos:start]))
+
+        value = data[start]
+        pos = RUN_PATTERNS[value].match(data, start).end()
+        length = pos - start
+        if length <= MAX_RUN:
+            append(bytes((value, length)))
+        else:
+            full_runs, remainder = divmod(length, MAX_RUN)
+            append(bytes((value, MAX_RUN)) * full_runs)
+            if remainder:
+                append(bytes((value, remainder)))
+        match = search(data, pos)
+
+    if pos < len(data):
+        append(encode_singles(data[pos:]))
+    return b''.join(pieces)
+
+def rle_decode_pieces(data):
+    """Yield the expansion of (byte, count) pairs piece by piece.
+
+    Long runs are split into pieces of at most CHUNK_SIZE bytes, so a small
+    input can never expand into one huge allocation.
+    """
+    for match in PAIR_PATTERN.finditer(data):
+        start, end = match.span()
+        if match.group(1) is None:
+            yield bytes(data[start:end:2])  # Single bytes: take every other byte
+            continue
+
+        byte = match.group(1)
+        total = match.group(2)[0] * ((end - start) // 2)
+        if total > CHUNK_SIZE:
+            block = byte * CHUNK_SIZE
+            while total > CHUNK_SIZE:
+                yield block
+                total -= CHUNK_SIZE
+        yield byte * total
+
+def rle_decode(data):
+    """Expand a stream of (byte, count) pairs produced by rle_encode."""
+    if len(data) % 2:
+        raise ValueError("Truncated RLE stream: odd number of bytes")
+    return b''.join(rle_decode_pieces(data))
+
+def trailing_run_remainder(data):
+    """Return how many bytes at the end of data belong to an unfinished run.
+
+    Full groups of MAX_RUN bytes from the final run can be encoded right away,
+    because runs are always split into groups counted from their first byte.
+    """
+    run_length = len(data) - len(data.rstrip(data[-1:]))
+    return run_length % MAX_RUN
+
+def iter_rle_encode(chunks):
+    """Run-length encode an iterable of byte chunks as one continuous stream.
+
+    Chunks are encoded through memoryviews, so only the few bytes carried
+    over to the next chunk are ever copied.
+    """
+    carry = b''
+    for chunk in chunks:
+        data = carry + chunk if carry else chunk
+        if not data:
+            continue
+        cut = len(data) - trailing_run_remainder(data)
+        view = memoryview(data)
+        yield rle_encode(view[:cut])
+        carry = bytes(view[cut:])  # Held back: the run may continue in the next chunk
+    if carry:
+        yield rle_encode(carry)
+
+def iter_rle_decode(chunks):
+    """Decode an iterable of RLE chunks, which may split a pair between them."""
+    carry = b''
+    for chunk in chunks:
+        data = carry + chunk if carry else chunk
+        cut = len(data) & ~1
+        view = memoryview(data)
+        yield from rle_decode_pieces(view[:cut])
+        carry = bytes(view[cut:])
+    if carry:
+        raise ValueError("Truncated RLE stream: odd number of bytes")
+
+def packbits_literals(data):
+    """Encode bytes as PackBits literal spans of at most 128 bytes."""
+    return b''.join([
+        bytes((len(span) - 1,)) + span
+        for span in (data[i:i + PACKBITS_MAX_SPAN] for i in range(0, len(data), PACKBITS_MAX_SPAN))
+    ])
+
+def packbits_encode(data):
+    """Encode data as a mix of literal spans and repeat runs (PackBits).
+
+    Each span starts with a control byte n: 0-127 is followed by n + 1
+    literal bytes, 129-255 by one byte repeated 257 - n times.  Runs shorter
+    than three bytes stay inside literal spans, so incompressible data grows
+    by at most one byte in 128.
+    """
+    pieces = []
+    append = pieces.append
+    search = PACKBITS_RUN_START_PATTERN.search
+    literal_start = 0
+    match = search(data)
+    while match:
+        start = match.start()
+        value = data[start]
+        end = RUN_PATTERNS[value].match(data, start).end()
+        if start > literal_start:
+            append(packbits_literals(data[literal_start:start]))
+
+        full_runs, remainder = divmod(end - start, PACKBITS_MAX_SPAN)
+        if full_runs:
+            append(bytes((257 - PACKBITS_MAX_SPAN, value)) * full_runs)
+        if remainder >= 2:
+            append(bytes((257 - remainder, value)))
+            literal_start = end
+        else:
+            literal_start = end - remainder  # A single leftover byte joins the next literal span
+        match = search(data, end)
+
+    if literal_start < len(data):
+        append(packbits_literals(data[literal_start:]))
+    return b''.join(pieces)
+
+def packbits_decode(data):
+    """Expand a stream of PackBits spans produced by packbits_encode."""
+    pieces = []
+    append = pieces.append
+    pos = 0
+    size = len(data)
+    while pos < size:
+        control = data[pos]
+        if control < 128:
+            end = pos + control + 2
+            if end > size:
+                raise ValueError("Truncated PackBits stream: literal span past the end")
+            append(data[pos + 1:end])
+            pos = end
+        elif control > 128:
+            if pos + 1 >= size:
+                raise ValueError("Truncated PackBits stream: missing repeated byte")
+            if control == 257 - PACKBITS_MAX_SPAN:
+                end = REPEATED_SPAN_PATTERN.match(data, pos).end()
+                append(data[pos + 1:pos + 2] * (PACKBITS_MAX_SPAN * ((end - pos) // 2)))
+                pos = end
+            else:
+                append(data[pos + 1:pos + 2] * (257 - control))
+                pos += 2
+        else:
+            pos += 1  # 128 is a no-op
+    return b''.join(pieces)
+
+def estimate_frequencies(data, stride=HUFFMAN_SAMPLE_STRIDE):
+    """Estimate the frequency of each byte value from every stride-th byte.
+
+    Byte values missing from the sample are counted separately, so every value
+    present in data gets a non-zero frequency and therefore a code.
+    """
+    frequencies = [0] * 256
+    sample = bytes(data[::stride])
+    for symbol, freq in Counter(sample).items():
+        frequencies[symbol] = freq * stride
+    for symbol, freq in Counter(bytes(data).translate(None, bytes(set(sample)))).items():
+        frequencies[symbol] = freq
+    return frequencies
+
+def huffman_code_lengths(frequencies):
+    """Return the Huffman code length of each of the 256 byte values.
+
+    Lengths are kept within HUFFMAN_MAX_BITS by flattening the frequencies
+    until the tree is shallow enough.
+    """
+    while True:
+        heap = [(freq, symbol, [symbol]) for symbol, freq in enumerate(frequencies) if freq]
+        lengths = [0] * 256
+        if len(heap) == 1:
+            lengths[heap[0][1]] = 1
+            return lengths
+
+        heapq.heapify(heap)
+        while len(heap) > 1:
+            freq_a, tie, symbols_a = heapq.heappop(heap)
+            freq_b, _, symbols_b = heapq.heappop(heap)
+            for symbol in symbols_a + symbols_b:
+                lengths[symbol] += 1
+            heapq.heappush(heap, (freq_a + freq_b, tie, symbols_a + symbols_b))
+
+        if max(lengths) <= HUFFMAN_MAX_BITS:
+            return lengths
+        frequencies = [(freq + 1) // 2 for freq in frequencies]
+
+def canonical_codes(lengths):
+    """Assign canonical Huffman codes: shorter codes first, then by byte value.
+
+    Returns a list of (symbol, code, length) triples in code order.
+    """
+    codes = []
+    code = 0
+    previous_length = 0
+    for length, symbol in sorted((length, symbol) for symbol, length in enumerate(lengths) if length):
+        code <<= length - previous_length
+        codes.append((symbol, code, length))
+        code += 1
+        previous_length = length
+    return codes
+
+def huffman_encode(data):
+    """Encode data with a canonical Huffman code built from its byte frequencies.
+
+    Each byte is mapped to its code as a string of '0'/'1' by str.translate,
+    and the joined bits are turned into bytes in a single int conversion.
+    """
+    lengths = huffman_code_lengths(estimate_frequencies(data))
+
+    table = [''] * 256
+    for symbol, code, length in canonical_codes(lengths):
+        table[symbol] = format(code, f'0{length}b')
+    bits = bytes(data).decode('latin-1').translate(table)
+    bits += '0' * (-len(bits) % 8)
+
+    packed_lengths = bytes((lengths[i] << 4) | lengths[i + 1] for i in range(0, 256, 2))
+    body = int(bits, 2).to_bytes(len(bits) // 8, 'big') if bits else b''
+    return HUFFMAN_HEADER.pack(len(data), packed_lengths) + body
+
+def huffman_decode_table(lengths):
+    """Build the decoder's lookup table for a canonical Huffman code.
+
+    The table maps every HUFFMAN_MAX_BITS-bit window, as a string of '0'/'1',
+    to (bytes of all the symbols whose codes fit entirely in it, number of
+    bits they use), so each lookup decodes several symbols at once.
+    """
+    width = HUFFMAN_MAX_BITS
+    first = [None] * (1 << width)  # Window -> (symbol, length) of the code it starts with
+    for symbol, code, length in canonical_codes(lengths):
+        shift = width - length
+        entry = (symbol, length)
+        first[code << shift:(code + 1) << shift] = [entry] * (1 << shift)
+
+    mask = (1 << width) - 1
+    table = {}
+    for window in range(1 << width):
+        symbols = bytearray()
+        used = 0
+        while True:
+            entry = first[(window << used) & mask]
+            if entry is None or used + entry[1] > width:
+                break
+            symbols.append(entry[0])
+            used += entry[1]
+        if used:
+            table[format(window, f'0{width}b')] = (bytes(symbols), used)
+    return table
+
+def huffman_decode(payload):
+    """Decode a payload produced by huffman_encode."""
+    if len(payload) < HUFFMAN_HEADER.size:
+        raise ValueError("Truncated Huffman payload")
+    count, packed_lengths = HUFFMAN_HEADER.unpack_from(payload)
+    if count == 0:
+        return b''
+
+    lengths = []
+    for pair in packed_lengths:
+        lengths += (pair >> 4, pair & 0x0F)
+    table = huffman_decode_table(lengths)
+
+    body = payload[HUFFMAN_HEADER.size:]
+    total_bits = len(body) * 8
+    # Pad with a full window of zeros so that every lookup sees a full window
+    bits = format(int.from_bytes(body, 'big'), f'0{total_bits}b') + '0' * HUFFMAN_MAX_BITS
+
+    pieces = []
+    append = pieces.append
+    width = HUFFMAN_MAX_BITS
+    pos = 0
+    try:
+        while pos < total_bits:
+            symbols, used = table[bits[pos:pos + width]]
+            append(symbols)
+            pos += used
+    except KeyError:
+        raise ValueError("Corrupt Huffman payload: invalid code") from None
+
+    data = b''.join(pieces)
+    if len(data) < count:
+        raise ValueError("Truncated Huffman payload")
+    return data[:count]
+
+def encode_varint(value):
+    """Encode a non-negative integer as a little-endian base-128 varint."""
+    encoded = bytearray()
+    while value > 0x7F:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return encoded
+
+def decode_varint(data, pos):
+    """Decode a varint from data at pos, returning (value, position after it)."""
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError("Truncated varint")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def common_length(data, a, b, known, limit):
+    """Return the length of the common prefix of data[a:] and data[b:].
+
+    The first `known` bytes are already known to match and the result is
+    capped at limit.  Slices are compared in steps that double while they
+    match and halve when they do not, so a long match costs only a
+    logarithmic number of comparisons.
+    """
+    length = known
+    step = 16
+    while length < limit:
+        step = min(step, limit - length)
+        if data[a + length:a + length + step] == data[b + length:b + length + step]:
+            length += step
+            step *= 2
+        elif step == 1:
+            break
+        else:
+            step //= 2
+    return length
+
+def lzss_encode(data, level=LZSS_DEFAULT_LEVEL):
+    """Encode data as LZSS sequences found with hash chains.
+
+    The output is a series of sequences, each a varint literal count, the
+    literal bytes, a varint match length (minus LZSS_MIN_MATCH) and a 2-byte
+    little-endian offset.  The last sequence stops after its literals.
+
+    Positions are chained by their first LZSS_MIN_MATCH bytes.  level (1-9)
+    sets how many chained candidates are compared (1 to 256) and the match
+    length that ends the search early.  Below level 4, the scan also speeds
+    up through long stretches without matches; from level 4, positions
+    inside matches are added to the chains too.
+    """
+    data = bytes(data)
+    size = len(data)
+    max_chain = 1 << (level - 1)
+    nice_length = 8 << level
+    insert_matched = level >= 4
+    skip_shift = level + 3 if level < 4 else None
+
+    head = {}
+    previous = [-1] * size
+    pieces = []
+    literal_start = 0
+    pos = 0
+    last = size - LZSS_MIN_MATCH
+    while pos <= last:
+        key = data[pos:pos + LZSS_MIN_MATCH]
+        candidate = head.get(key, -1)
+        head[key] = pos
+        previous[pos] = candidate
+
+        best_length = 0
+        best_offset = 0
+        limit = min(LZSS_MAX_MATCH, size - pos)
+        chain = max_chain
+        while candidate >= 0 and pos - candidate <= LZSS_WINDOW and chain:
+            # A candidate can only beat the best match if it also matches the next byte
+            if best_length == 0 or data[candidate + best_length] == data[pos + best_length]:
+                length = common_length(data, candidate, pos, LZSS_MIN_MATCH, limit)
+                if length > best_length:
+                    best_length, best_offset = length, pos - candidate
+                    if length >= nice_length or length == limit:
+                        break
+            candidate = previous[candidate]
+            chain -= 1
+
+        if best_length < LZSS_MIN_MATCH:
+            pos += 1 if skip_shift is None else 1 + ((pos - literal_start) >> skip_shift)
+            continue
+
+        pieces += (encode_varint(pos - literal_start), data[literal_start:pos],
+                   encode_varint(best_length - LZSS_MIN_MATCH), best_offset.to_bytes(2, 'little'))
+        if insert_matched and best_length <= nice_length:
+            for inner in range(pos + 1, min(pos + best_length, last + 1)):
+                key = data[inner:inner + LZSS_MIN_MATCH]
+                previous[inner] = head.get(key, -1)
+                head[key] = inner
+        pos += best_length
+        literal_start = pos
+
+    pieces += (encode_varint(size - literal_start), data[literal_start:])
+    return b''.join(pieces)
+
+def lzss_decode(payload):
+    """Decode a payload produced by lzss_encode.
+
+    Matches are copied with slices of the output; a match overlapping the
+    bytes it produces repeats its source pattern instead.
+    """
+    out = bytearray()
+    pos = 0
+    size = len(payload)
+    while True:
+        count, pos = decode_varint(payload, pos)
+        if pos + count > size:
+            raise ValueError("Truncated LZSS payload: literals past the end")
+        out += payload[pos:pos + count]
+        pos += count
+        if pos == size:
+            return bytes(out)
+
+        length, pos = decode_varint(payload, pos)
+        length += LZSS_MIN_MATCH
+        if pos + 2 > size:
+            raise ValueError("Truncated LZSS payload: missing match offset")
+        offset = payload[pos] | (payload[pos + 1] << 8)
+        pos += 2
+        if offset == 0 or offset > len(out):
+            raise ValueError("Corrupt LZSS payload: match offset out of range")
+
+        start = len(out) - offset
+        if offset >= length:
+            out += out[start:start + length]
+        else:
+            out += (out[start:] * (length // offset + 1))[:length]
+
+# Block codecs of the framed format: codec id -> (name, encode, decode)
+CODECS = {
+    CODEC_RLE: ('rle', rle_encode, rle_decode),
+    CODEC_PACKBITS: ('packbits', packbits_encode, packbits_decode),
+    CODEC_STORE: ('store', bytes, bytes),
+    CODEC_ZLIB: ('zlib', zlib.compress, zlib.decompress),
+    CODEC_BZ2: ('bz2', bz2.compress, bz2.decompress),
+    CODEC_LZMA: ('lzma', lzma.compress, lzma.decompress),
+    CODEC_HUFFMAN: ('huffman', huffman_encode, huffman_decode),
+    CODEC_LZSS: ('lzss', lzss_encode, lzss_decode),
+}
+CODEC_IDS = {name: codec for codec, (name, _, _) in CODECS.items()}
+
+def sample_block(block):
+    """Return the part of a block that trial encodes are run on."""
+    if len(block) <= SAMPLE_WINDOWS * SAMPLE_WINDOW_SIZE:
+        return block
+    step = (len(block) - SAMPLE_WINDOW_SIZE) // (SAMPLE_WINDOWS - 1)
+    return b''.join(block[i * step:i * step + SAMPLE_WINDOW_SIZE] for i in range(SAMPLE_WINDOWS))
+
+def encode_block(block, codec, level=None):
+    """Encode a block with a codec, at an effort level if the codec has them."""
+    encode = CODECS[codec][1]
+    if level is not None and codec in LEVELED_CODECS:
+        return encode(block, level)
+    return encode(block)
+
+def select_codec(block, prefer='speed', level=None):
+    """Pick the codec that best meets the speed or ratio goal for a block.
+
+    Returns (codec, payload).  When the block is small enough to be its own
+    sample, payload is the trial encode of the whole block; otherwise None.
+    """
+    sample = sample_block(block)
+    candidates = SPEED_CODECS if prefer == 'speed' else RATIO_CODECS
+    trials = [(codec, encode_block(sample, codec, level)) for codec in candidates]
+
+    smallest = min(len(encoded) for _, encoded in trials)
+    margin = SPEED_MARGIN * len(sample) if prefer == 'speed' else 0
+    codec, encoded = next(trial for trial in trials if len(trial[1]) <= smallest + margin)
+    return codec, (encoded if sample is block else None)
+
+def compress_block(block, codec=CODEC_RLE, prefer='speed', level=None):
+    """Compress one block of the framed format.
+
+    codec None picks one for this block with select_codec.  level is passed
+    to the codecs that take an effort level.  Returns (codec,
+    raw size, CRC-32, payload), so the checksum is also computed in the worker
+    when running on a pool.
+    """
+    crc = zlib.crc32(block)
+    if codec is not None:
+        return codec, len(block), crc, encode_block(block, codec, level)
+
+    codec, payload = select_codec(block, prefer, level)
+    if payload is None:
+        payload = encode_block(block, codec, level)
+    if len(payload) > len(block):  # The sample was not representative
+        codec, payload = CODEC_STORE, bytes(block)
+    return codec, len(block), crc, payload
+
+def decompress_block(frame):
+    """Decompress one (codec, payload, raw size, CRC-32) frame of the framed format.
+
+    Version 1 frames have no checksum and pass None for it.
+    """
+    codec, payload, raw_size, crc = frame
+    data = CODECS[codec][2](payload)
+    if len(data) != raw_size:
+        raise ValueError(f"Corrupt frame: expected {raw_size} bytes, decoded {len(data)}")
+    if crc is not None and zlib.crc32(data) != crc:
+        raise ValueError("Corrupt frame: checksum mismatch")
+    return data
+
+def map_ordered(func, items, jobs):
+    """Apply func to items on a pool of `jobs` processes, yielding results in order.
+
+    At most 2 * jobs items are in flight at once, so memory stays bounded
+    however many items there are.
+    """
+    if jobs <= 1:
+        yield from map(func, items)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def iter_framed_encode(chunks, jobs=1, codec=CODEC_RLE, prefer='speed', level=None):
+    """Compress each chunk as an independent block of the framed format.
+
+    codec None picks a codec per block according to prefer.
+    """
+    header = FRAME_MAGIC + bytes((FRAME_VERSION,))
+    yield header
+
+    offset = len(header)
+    original_size = 0
+    index = []
+    blocks = map_ordered(partial(compress_block, codec=codec, prefer=prefer, level=level), chunks, jobs)
+    for block_codec, raw_size, crc, payload in blocks:
+        index.append(INDEX_ENTRY.pack(offset, block_codec, len(payload), raw_size, crc))
+        yield FRAME_HEADER.pack(block_codec, len(payload), raw_size, crc)
+        yield payload
+        offset += FRAME_HEADER.size + len(payload)
+        original_size += raw_size
+
+    yield FRAME_HEADER.pack(0, 0, 0, 0)
+    yield b''.join(index)
+    yield TRAILER.pack(offset + FRAME_HEADER.size, original_size, len(index), FRAME_MAGIC)
+
+def read_exactly(f, size):
+    """Read exactly size bytes from f, failing on a truncated stream."""
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated framed stream")
+    return data
+
+def read_container_header(f):
+    """Read the rest of the container header after FRAME_MAGIC.
+
+    Returns (version, codec), where codec is the codec of every block for
+    archives older than version 3, and None when each frame names its own.
+    """
+    version = read_exactly(f, 1)[0]
+    if version == 1:
+        return version, CODEC_RLE
+    if version == FRAME_VERSION:
+        return version, None
+    if version != 2:
+        raise ValueError(f"Unsupported framed format version {version}")
+
+    codec = read_exactly(f, 1)[0]
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported codec {codec}")
+    return version, codec
+
+def frame_header_layout(version):
+    """Return the frame header struct used by a framed format version."""
+    return {1: FRAME_HEADER_V1, 2: FRAME_HEADER_V2}.get(version, FRAME_HEADER)
+
+def iter_frames(f, version, codec=None):
+    """Yield (codec, payload, raw size, CRC-32) for each frame of a framed stream.
+
+    f must be positioned just after the container header, and codec is the
+    archive-wide codec returned by read_container_header.  For archives with
+    an index, the trailer is read at the end to check the total size.
+    """
+    header = frame_header_layout(version)
+    total = 0
+    while True:
+        fields = header.unpack(read_exactly(f, header.size))
+        if version == 1:
+            (payload_size, raw_size), crc = fields, None
+        elif version == 2:
+            payload_size, raw_size, crc = fields
+        else:
+            codec, payload_size, raw_size, crc = fields
+        if payload_size == 0 and raw_size == 0:
+            break
+        if codec not in CODECS:
+            raise ValueError(f"Unsupported codec {codec}")
+        total += raw_size
+        yield codec, read_exactly(f, payload_size), raw_size, crc
+
+    if version > 1:
+        rest = f.read()
+        if len(rest) < TRAILER.size:
+            raise ValueError("Truncated framed stream")
+        _, original_size, _, magic = TRAILER.unpack(rest[-TRAILER.size:])
+        if magic != FRAME_MAGIC or original_size != total:
+            raise ValueError("Corrupt archive: trailer does not match the blocks")
+
+def read_index(f, version, codec=None):
+    """Read the block index of a seekable archive.
+
+    Returns (original size, list of (frame offset, codec, compressed size,
+    raw size, CRC-32) entries).
+    """
+    f.seek(-TRAILER.size, os.SEEK_END)
+    index_offset, original_size, count, magic = TRAILER.unpack(read_exactly(f, TRAILER.size))
+    if magic != FRAME_MAGIC:
+        raise ValueError("Missing block index: the archive is truncated")
+
+    entry = INDEX_ENTRY_V2 if version == 2 else INDEX_ENTRY
+    f.seek(index_offset)
+    table = read_exactly(f, count * entry.size)
+    if version == 2:
+        index = [(offset, codec, payload_size, raw_size, crc)
+                 for offset, payload_size, raw_size, crc in entry.iter_unpack(table)]
+    else:
+        index = list(entry.iter_unpack(table))
+    return original_size, index
+
+def read_range(f, offset, length=None, jobs=1, version=FRAME_VERSION, codec=None):
+    """Decode bytes [offset, offset + length) of a seekable archive.
+
+    Only the blocks overlapping the range are read and decoded, and the
+    result is built in a buffer allocated once at its exact final size.
+    """
+    original_size, index = read_index(f, version, codec)
+    start = min(offset, original_size)
+    end = original_size if length is None else min(original_size, start + length)
+    result = bytearray(max(end - start, 0))
+    if not result:
+        return result
+
+    block_starts = list(accumulate((entry[3] for entry in index), initial=0))
+    first = bisect_right(block_starts, start) - 1
+    last = bisect_right(block_starts, end - 1) - 1
+    header_size = frame_header_layout(version).size
+
+    def frames():
+        for frame_offset, block_codec, payload_size, raw_size, crc in index[first:last + 1]:
+            f.seek(frame_offset + header_size)
+            yield block_codec, read_exactly(f, payload_size), raw_size, crc
+
+    blocks = map_ordered(decompress_block, frames(), jobs)
+    for block_start, data in zip(block_starts[first:last + 1], blocks):
+        lo = max(start, block_start)
+        hi = min(end, block_start + len(data))
+        result[lo - start:hi - start] = data[lo - block_start:hi - block_start]
+    return result
+
+def slice_pieces(pieces, offset, length=None):
+    """Yield only bytes [offset, offset + length) of a stream of pieces."""
+    end = None if length is None else offset + length
+    pos = 0
+    for piece in pieces:
+        piece_end = pos + len(piece)
+        if piece_end > offset:
+            yield piece[max(offset - pos, 0):None if end is None else max(end - pos, 0)]
+        pos = piece_end
+        if end is not None and pos >= end:
+            return
+
+def read_chunks(f, chunk_size=CHUNK_SIZE):
+    """Yield successive chunks of at most chunk_size from an open file."""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+def open_input(path):
+    """Open path for reading bytes, or wrap stdin when path is '-'."""
+    if path == '-':
+        return contextlib.nullcontext(sys.stdin.buffer)
+    return open(path, 'rb')
+
+def open_output(path):
+    """Open path for writing bytes, or wrap stdout when path is '-'."""
+    if path == '-':
+        return contextlib.nullcontext(sys.stdout.buffer)
+    return open(path, 'wb')
+
+def compress_file(input_path, output_path, chunk_size=CHUNK_SIZE, framed=False, jobs=1,
+                  codec=CODEC_RLE, prefer='speed', level=None):
+    """Compress input_path to output_path.
+
+    Every file is handled as bytes: it is read once, in chunks, and the
+    output is written as it is produced.
+    """
+    with open_input(input_path) as f_in, open_output(output_path) as f_out:
+        chunks = read_chunks(f_in, chunk_size)
+        if framed:
+            f_out.writelines(iter_framed_encode(chunks, jobs, codec, prefer, level))
+        else:
+            f_out.writelines(iter_rle_encode(chunks))
+
+def decompress_file(input_path, output_path, chunk_size=CHUNK_SIZE, jobs=1, offset=0, length=None):
+    """Decompress input_path, or only bytes [offset, offset + length) of it."""
+    ranged = offset > 0 or length is not None
+
+    with open_input(input_path) as f_in, open_output(output_path) as f_out:
+        head = f_in.read(len(FRAME_MAGIC))
+        if head == FRAME_MAGIC:
+            version, codec = read_container_header(f_in)
+            if ranged and version > 1 and f_in.seekable():
+                f_out.write(read_range(f_in, offset, length, jobs, version, codec))
+                return
+            pieces = map_ordered(decompress_block, iter_frames(f_in, version, codec), jobs)
+        else:
+            pieces = iter_rle_decode(chain([head], read_chunks(f_in, chunk_size)))
+
+        # Without an index the range can only be cut out of the decoded stream
+        if ranged:
+            pieces = slice_pieces(pieces, offset, length)
+        f_out.writelines(pieces)
 
 def main():
     parser = argparse.ArgumentParser(description="Universal File Compression/Decompression Tool")
     parser.add_argument("operation", choices=["compress", "decompress"], help="Choose the operation to perform")
-    parser.add_argument("input_path", help="Path to the input file")
-    parser.add_argument("output_path", help="Path to the output file")
+    parser.add_argument("input_path", help="Path to the input file, or '-' for stdin")
+    parser.add_argument("output_path", help="Path to the output file, or '-' for stdout")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help=f"Bytes read per block when streaming (default: {CHUNK_SIZE})")
+    parser.add_argument("--format", choices=["raw", "framed"], default="raw",
+                        help="Output format for compression: plain RLE pairs, or independent "
+                             "blocks that can be processed in parallel (default: raw)")
+    parser.add_argument("--codec", choices=list(CODEC_IDS) + ["auto"], default="rle",
+                        help="Block codec for the framed format.  packbits never grows data by more "
+                             "than 1%%; auto picks a codec for each block from a sample of it (default: rle)")
+    parser.add_argument("--prefer", choices=["speed", "ratio"], default="speed",
+                        help="Goal used by --codec auto: the cheapest codec that compresses nearly as "
+                             "well as the best, or the smallest output (default: speed)")
+    parser.add_argument("--level", type=int, choices=range(1, 10), metavar="{1-9}",
+                        help="Effort level for the zlib, bz2 and lzss codecs: higher is slower "
+                             "but compresses better (default: each codec's own)")
+    parser.add_argument("--no-preflight", action="store_true",
+                        help="Compress framed output even when sampling says the input is incompressible")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Report the preflight estimate and decision")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Worker processes for framed compression and decompression (default: 1)")
+    parser.add_argument("--offset", type=int, default=0,
+                        help="Decompress only from this byte offset of the original data")
+    parser.add_argument("--length", type=int,
+                        help="Decompress only this many bytes (default: up to the end)")
 
     args = parser.parse_args()
 
-    if not os.path.exists(args.input_path):
-        print(f"Error: File '{args.input_path}' does not exist.")
+    # Keep status messages out of the data stream when writing to stdout
+    status = sys.stderr if args.output_path == '-' else sys.stdout
+
+    if args.chunk_size < 1:
+        print("Error: --chunk-size must be a positive number of bytes.", file=status)
+        return
+
+    if args.jobs < 1:
+        print("Error: --jobs must be at least 1.", file=status)
         return
 
-    binary_mode = is_binary(args.input_path)
+    if args.operation == "compress" and args.jobs > 1 and args.format != "framed":
+        print("Error: --jobs needs --format framed when compressing.", file=status)
+        return
+
+    if args.operation == "compress" and args.codec != "rle" and args.format != "framed":
+        print(f"Error: --codec {args.codec} needs --format framed.", file=status)
+        return
+
+    if args.offset < 0 or (args.length is not None and args.length < 0):
+        print("Error: --offset and --length cannot be negative.", file=status)
+        return
+
+    if args.input_path != '-' and not os.path.exists(args.input_path):
+        print(f"Error: File '{args.input_path}' does not exist.", file=status)
+        return
 
     if args.operation == "compress":
+        codec = CODEC_IDS.get(args.codec)
+        framed = args.format == "framed"
+        if args.input_path == '-':
+            decision = "skipped, stdin cannot be sampled"
+        elif args.no_preflight:
+            decision = "skipped"
+        else:
+            ratio = preflight(args.input_path)
+            if ratio < INCOMPRESSIBLE_RATIO:
+                decision = f"estimated ratio {ratio:.3f}, compressing"
+            elif framed:
+                codec = CODEC_STORE
+                decision = f"estimated ratio {ratio:.3f}, storing uncompressed"
+            else:
+                decision = f"estimated ratio {ratio:.3f}, compressing anyway: only --format framed can store data"
+        if args.verbose:
+            print(f"Preflight: {decision}", file=status)
+
         try:
-            compress_file(args.input_path, args.output_path, binary_mode)
-            print(f"File successfully compressed to {args.output_path}")
+            compress_file(args.input_path, args.output_path, args.chunk_size, framed, args.jobs,
+                          codec, args.prefer, args.level)
+            print(f"File successfully compressed to {args.output_path}", file=status)
         except Exception as e:
-            print(f"An error occurred during compression: {e}")
+            print(f"An error occurred during compression: {e}", file=status)
 
     elif args.operation == "decompress":
         try:
-            decompress_file(args.input_path, args.output_path, binary_mode)
-            print(f"File successfully decompressed to {args.output_path}")
+            decompress_file(args.input_path, args.output_path, args.chunk_size, args.jobs,
+                            args.offset, args.length)
+            print(f"File successfully decompressed to {args.output_path}", file=status)
         except Exception as e:
-            print(f"An error occurred during decompression: {e}")
+            print(f"An error occurred during decompression: {e}", file=status)
 
 if __name__ == "__main__":
     main()
@@ -1,86 +1,587 @@
 #!/usr/bin/env python3
 
 import argparse
+import functools
+import math
+import operator
+import os
+import random
+import sys
+from collections import namedtuple
+from functools import partial
+
 from PIL import Image
 
-def hide_message_in_image(image_path, output_path, message):
-    # Open the image
-    image = Image.open(image_path)
-    image = image.convert('RGB')  # Ensure the image is in RGB format
-    pixels = image.load()
+import batch
+import bitbuffer
+import bmpstrips
+import imagemodes
+import payload
+import pngstrips
+
+STRIDE = 7  # By default the message bits live in every 7th pixel, in raster order
+CHANNELS = 'RGBA'
+
+# Where the bits go: every `stride`-th pixel, the given channels of each in
+# order, and the `bits` low bits of each channel, high bit first. With a
+# key, those pixels are visited in a keyed pseudo-random order instead of
+# raster order.
+Layout = namedtuple('Layout', 'stride channels bits key', defaults=(None,))
+DEFAULT_LAYOUT = Layout(STRIDE, 'R', 1)
+
+# A keyed order over the `stride`-th pixels ("candidates"), split into
+# `blocks` runs of `block` candidates. Round t visits candidate
+# offsets[t] of every block, with the blocks shuffled by `order` and the
+# result rotated by rotations[t]; permute and unpermute apply the shuffle
+# and its inverse to a whole round of bytes at once.
+KeyedOrder = namedtuple('KeyedOrder', 'block blocks permute unpermute offsets rotations')
+KEYED_ORDER_CACHE_SIZE = 8
+
+def layout_mode(layout):
+    """Return the image mode a layout needs: RGBA when it uses alpha, RGB otherwise."""
+    return 'RGBA' if 'A' in layout.channels else 'RGB'
+
+def channel_offsets(mode, layout):
+    """Return the byte offset within a pixel of each layout channel, or None if the mode lacks one.
+
+    In L, LA and P images the gray level or palette index stands in for a
+    single colour channel, which is what an RGB conversion would give for
+    grayscale.
+    """
+    colours = layout.channels.replace('A', '')
+    if mode in ('RGB', 'RGBA'):
+        bands = mode
+    elif mode in ('L', 'LA', 'P') and len(colours) <= 1:
+        bands = (colours or '-') + mode[1:]  # The first band stays first even when only alpha is used
+    else:
+        return None
+    if any(channel not in bands for channel in layout.channels):
+        return None
+    return [bands.index(channel) for channel in layout.channels]
+
+def carrier_mode(mode, layout):
+    """Return the mode to hide in for an image of `mode`: its own when the layout fits it."""
+    mode = imagemodes.native_mode(mode)
+    return mode if channel_offsets(mode, layout) is not None else layout_mode(layout)
+
+def capacity_bits(size, layout=DEFAULT_LAYOUT):
+    """Return how many bits an image of the given (width, height) holds with a layout."""
+    width, height = size
+    candidates = (width * height + layout.stride - 1) // layout.stride
+    if layout.key is not None:
+        block = math.isqrt(candidates)
+        candidates = candidates // block * block  # The last partial block is left out
+    return candidates * len(layout.channels) * layout.bits
+
+def payload_capacity(size, layout=DEFAULT_LAYOUT):
+    """Return the largest framed payload, in bytes, an image of the given size holds."""
+    return payload.max_payload(capacity_bits(size, layout) // 8)
+
+def gather_values(raw, mode, first, pixels, layout):
+    """Return the carrier bytes of `pixels` selected pixels, starting at pixel `first` of raw.
+
+    raw holds pixels of the given mode. The channels of each pixel are
+    interleaved in layout order, one strided slice per channel.
+    """
+    step = layout.stride * imagemodes.pixel_size(mode)
+    start = first * imagemodes.pixel_size(mode)
+    values = bytearray(pixels * len(layout.channels))
+    for j, channel_offset in enumerate(channel_offsets(mode, layout)):
+        offset = start + channel_offset
+        values[j::len(layout.channels)] = raw[offset:offset + pixels * step:step]
+    return values
+
+def scatter_values(raw, mode, first, values, layout):
+    """Write carrier bytes gathered by gather_values back into place."""
+    step = layout.stride * imagemodes.pixel_size(mode)
+    start = first * imagemodes.pixel_size(mode)
+    pixels = len(values) // len(layout.channels)
+    for j, channel_offset in enumerate(channel_offsets(mode, layout)):
+        offset = start + channel_offset
+        raw[offset:offset + pixels * step:step] = values[j::len(layout.channels)]
+
+def embed_groups(raw, mode, first, pixels, groups, layout):
+    """Hide as many bit groups as fit in `pixels` selected pixels of raw, from pixel `first` on.
+
+    Returns how many groups were hidden.
+    """
+    pixels = min(pixels, -(-len(groups) // len(layout.channels)))
+    values = gather_values(raw, mode, first, pixels, layout)
+    count = min(len(values), len(groups))
+
+    # Modify the low bits of every carrier byte at once, then put them back
+    values[:count] = payload.embed_bits(values[:count], groups[:count], layout.bits)
+    scatter_values(raw, mode, first, values, layout)
+    return count
+
+def permuter(order):
+    """Return a function that reorders a sequence of bytes so that item i is the old item order[i]."""
+    if len(order) == 1:
+        return bytes  # itemgetter with one index returns an int, not a tuple
+    getter = operator.itemgetter(*order)
+    return lambda values: bytes(getter(values))
+
+@functools.lru_cache(maxsize=KEYED_ORDER_CACHE_SIZE)
+def keyed_order(candidates, key):
+    """Return the KeyedOrder of `candidates` pixels for a key.
+
+    Blocks and rounds both number about sqrt(candidates), so the whole
+    order comes from two shuffles of that size, and every round is one
+    strided slice per channel reordered in C. The sequence is a
+    permutation of the candidates and does not depend on the payload
+    length, so an extractor can follow it before it knows how much to read.
+    """
+    block = math.isqrt(candidates)
+    blocks = candidates // block
+    rng = random.Random(key)
+    order = list(range(blocks))
+    rng.shuffle(order)
+    offsets = list(range(block))
+    rng.shuffle(offsets)
+    rotations = [rng.randrange(blocks) for _ in range(block)]
+    inverse = [0] * blocks
+    for position, index in enumerate(order):
+        inverse[index] = position
+    return KeyedOrder(block, blocks, permuter(order), permuter(inverse), offsets, rotations)
+
+def round_layout(layout, keyed, t):
+    """Return (first pixel, layout) for the raster slice of the pixels keyed round t visits."""
+    return keyed.offsets[t] * layout.stride, layout._replace(stride=keyed.block * layout.stride)
+
+def gather_round(raw, mode, layout, keyed, t):
+    """Return the carrier bytes of keyed round t, in keyed order."""
+    first, slice_layout = round_layout(layout, keyed, t)
+    values = gather_values(raw, mode, first, keyed.blocks, slice_layout)
+    lanes = len(layout.channels)
+    rotation = keyed.rotations[t]
+    for j in range(lanes):
+        lane = keyed.permute(values[j::lanes])
+        values[j::lanes] = lane[rotation:] + lane[:rotation]
+    return values
+
+def scatter_round(raw, mode, layout, keyed, t, values):
+    """Write the carrier bytes of keyed round t, given in keyed order, back into place."""
+    first, slice_layout = round_layout(layout, keyed, t)
+    lanes = len(layout.channels)
+    rotation = keyed.blocks - keyed.rotations[t]
+    for j in range(lanes):
+        lane = bytes(values[j::lanes])
+        values[j::lanes] = keyed.unpermute(lane[rotation:] + lane[:rotation])
+    scatter_values(raw, mode, first, values, slice_layout)
+
+def keyed_order_for(size, layout):
+    """Return the KeyedOrder of an image of the given size under a keyed layout."""
+    width, height = size
+    return keyed_order((width * height + layout.stride - 1) // layout.stride, layout.key)
+
+def embed_keyed_groups(raw, mode, size, groups, layout):
+    """Hide bit groups in raw following a keyed layout, a round at a time."""
+    keyed = keyed_order_for(size, layout)
+    done = 0
+    for t in range(keyed.block):
+        if done >= len(groups):
+            break
+        values = gather_round(raw, mode, layout, keyed, t)
+        count = min(len(values), len(groups) - done)
+        values[:count] = payload.embed_bits(values[:count], groups[done:done + count], layout.bits)
+        scatter_round(raw, mode, layout, keyed, t, values)
+        done += count
+
+def iter_keyed_bits(image, layout):
+    """Yield the bits hidden in an image under a keyed layout as BitBuffers, a round at a time."""
+    raw = image.tobytes()
+    keyed = keyed_order_for(image.size, layout)
+    for t in range(keyed.block):
+        yield bitbuffer.pack(gather_round(raw, image.mode, layout, keyed, t), layout.bits)
+
+def message_to_binary(message):
+    """Return the bits of a message as a BitBuffer, eight per character, null-terminated."""
+    return bitbuffer.from_text(message + '\0')  # Add a null character to mark the end of the message
+
+def binary_to_groups(size, bits, layout, truncate):
+    """Check a BitBuffer against the capacity of an image of the given size and split it into groups.
+
+    Bits that do not fit are dropped when truncate is set, otherwise a
+    ValueError is raised.
+    """
+    capacity = capacity_bits(size, layout)
+    if bits.length > capacity:
+        if not truncate:
+            room = payload_capacity(size, layout)
+            raise ValueError("Payload is too large to hide in this image! " +
+                             (f"It holds at most {room} bytes." if room >= 0 else
+                              "It is too small for a framed payload."))
+        bits = bitbuffer.bit_slice(bits, 0, capacity)
+    return bitbuffer.unpack(bits, layout.bits)
+
+def embed_binary(image, bits, layout=DEFAULT_LAYOUT, truncate=False):
+    """Return a copy of an image with the bits of a BitBuffer hidden in it following layout."""
+    groups = binary_to_groups(image.size, bits, layout, truncate)
+    if image.mode == 'P':
+        image = imagemodes.sort_palette(image)
+    raw = bytearray(image.tobytes())
+    if layout.key is not None:
+        embed_keyed_groups(raw, image.mode, image.size, groups, layout)
+    else:
+        embed_groups(raw, image.mode, 0, len(groups), groups, layout)
+    return imagemodes.replace_pixels(image, raw)
+
+def embed_message(image, message, layout=DEFAULT_LAYOUT):
+    """Return a copy of an image with a null-terminated message hidden in it."""
+    # Bits beyond the last pixel are dropped
+    return embed_binary(image, message_to_binary(message), layout, truncate=True)
 
-    # Convert the message to binary
-    message_binary = ''.join(format(ord(char), '08b') for char in message)
-    message_binary += '00000000'  # Add a null character to mark the end of the message
+def embed_payload(image, data, layout=DEFAULT_LAYOUT):
+    """Return a copy of an image with data hidden in it as a framed payload."""
+    return embed_binary(image, bitbuffer.from_bytes(payload.frame_payload(data)), layout)
 
+def iter_image_strips(image, rows=8):
+    """Yield (top, strip) for an image in memory, in strips of rows.
+
+    Strips start small and double in height, so a short message near the
+    top of the image is read without touching the rest of it.
+    """
     width, height = image.size
-    pixel_count = 0
-    binary_index = 0
+    top = 0
+    while top < height:
+        bottom = min(height, top + rows)
+        yield top, image.crop((0, top, width, bottom))
+        top = bottom
+        rows *= 2
 
-    for y in range(height):
-        for x in range(width):
-            if pixel_count % 7 == 0 and binary_index < len(message_binary):
-                r, g, b = pixels[x, y]
+def iter_file_strips(f, layout, rows, grow=False):
+    """Return ((width, height), mode, strips) for the PNG or BMP in f, decoded `rows` rows at a time.
 
-                # Modify the least significant bit of the red channel to store the message bit
-                new_r = (r & ~1) | int(message_binary[binary_index])
-                pixels[x, y] = (new_r, g, b)
-                binary_index += 1
+    Strips are in mode, the carrier mode for the layout. With grow, rows
+    doubles after every strip. Raises ValueError for other formats and for
+    PNG or BMP variants that cannot be decoded in strips.
+    """
+    reader = bmpstrips if f.read(2) == b'BM' else pngstrips
+    f.seek(0)
+    size, mode, strips = reader.read_strips(f, rows, grow)
+    if carrier_mode(mode, layout) != mode:
+        mode = carrier_mode(mode, layout)
+        strips = ((top, strip.convert(mode)) for top, strip in strips)
+    return size, mode, strips
 
-            pixel_count += 1
+def iter_hidden_bits(strips, width, layout=DEFAULT_LAYOUT):
+    """Yield the bits hidden in each (top, strip) of an image as BitBuffers."""
+    for top, strip in strips:
+        raw = strip.tobytes()
+        first = -top * width % layout.stride  # Offset of the first selected pixel in this strip
+        pixels = len(range(first, strip.width * strip.height, layout.stride))
+        values = gather_values(raw, strip.mode, first, pixels, layout)
+        yield bitbuffer.pack(values, layout.bits)
 
-    # Save the modified image
-    image.save(output_path)
-    print(f"Message hidden in {output_path}")
+def iter_hidden_bytes(bit_chunks):
+    """Yield whole bytes from BitBuffers of hidden bits, carrying bytes split between two strips."""
+    return bitbuffer.iter_bytes(bit_chunks)
+
+def message_from_bits(bit_chunks):
+    """Return the null-terminated message in BitBuffers of hidden bits.
+
+    Bits are decoded a chunk at a time and extraction stops at the first
+    null byte, so the cost follows the message length, not the image size.
+    """
+    message = bytearray()
+    pending = bitbuffer.BitBuffer(b'', 0)  # Bits of a byte split between two strips
+    for bits in bit_chunks:
+        bits = bitbuffer.concat(pending, bits)
+
+        # Take the whole bytes, keeping the bits of a split one for the next strip
+        whole = bits.length // 8 * 8
+        data = bitbuffer.to_bytes(bitbuffer.bit_slice(bits, 0, whole))
+        pending = bitbuffer.bit_slice(bits, whole)
+
+        end = data.find(0)  # Stop at the null character
+        if end >= 0:
+            message += data[:end]
+            return message.decode('latin-1')
+        message += data
+
+    if pending.length:
+        message.append(bitbuffer.to_int(pending))  # Leftover bits form a final short byte
+    return message.decode('latin-1')
+
+def iter_image_bits(image, layout=DEFAULT_LAYOUT):
+    """Yield the bits hidden in an image in memory as BitBuffers, in layout order."""
+    if layout.key is not None:
+        return iter_keyed_bits(image, layout)
+    return iter_hidden_bits(iter_image_strips(image), image.width, layout)
+
+def extract_message(image, layout=DEFAULT_LAYOUT):
+    """Return the null-terminated message hidden in an image."""
+    return message_from_bits(iter_image_bits(image, layout))
+
+def extract_payload(image, layout=DEFAULT_LAYOUT):
+    """Return the framed payload hidden in an image, reading only the strips or rounds it covers."""
+    return payload.read_payload(payload.byte_reader(iter_hidden_bytes(iter_image_bits(image, layout))))
+
+def embed_binary_in_strips(image_path, output_path, bits, layout, rows, truncate=False):
+    """Hide the bits of a BitBuffer in a PNG a band of `rows` rows at a time, writing a PNG.
+
+    Only one band is decoded at once, so memory stays proportional to the
+    band size; the pixels written match embed_binary on the whole image.
+    """
+    if layout.key is not None:
+        raise ValueError("A keyed layout spreads the payload over the whole image and cannot be hidden in strips!")
+    with open(image_path, 'rb') as f_in:
+        size, mode, strips = iter_file_strips(f_in, layout, rows)
+        groups = memoryview(binary_to_groups(size, bits, layout, truncate))
+
+        def modified_strips():
+            done = 0
+            for top, strip in strips:
+                if done < len(groups):
+                    raw = bytearray(strip.tobytes())
+                    first = -top * size[0] % layout.stride
+                    pixels = len(range(first, strip.width * strip.height, layout.stride))
+                    done += embed_groups(raw, strip.mode, first, pixels, groups[done:], layout)
+                    strip = Image.frombytes(strip.mode, strip.size, bytes(raw))
+                yield strip
+
+        with open(output_path, 'wb') as f_out:
+            pngstrips.write_png_strips(f_out, size, mode, modified_strips())
+
+def hidden_bits_in_file(image_path, layout, strip_rows=None):
+    """Yield the bits hidden in an image file as BitBuffers, decoding only the rows read.
+
+    PNG and BMP carriers are decoded in strips: of strip_rows rows when
+    given, otherwise starting at 8 rows and doubling, so a short payload
+    near the top of a large image costs a few rows instead of a full
+    decode. Other carriers, and keyed layouts, which spread the bits over
+    the whole image, are decoded whole, unless strip_rows asks for strips
+    explicitly.
+    """
+    if layout.key is not None:
+        if strip_rows:
+            raise ValueError("A keyed layout spreads the payload over the whole image and cannot be read in strips!")
+        yield from iter_keyed_bits(open_image(image_path, layout), layout)
+        return
+    with open(image_path, 'rb') as f:
+        try:
+            size, _, strips = iter_file_strips(f, layout, strip_rows or 8, grow=not strip_rows)
+        except ValueError:
+            if strip_rows:
+                raise
+            image = open_image(image_path, layout)
+            size, strips = image.size, iter_image_strips(image)
+        yield from iter_hidden_bits(strips, size[0], layout)
 
-def extract_message_from_image(image_path):
-    # Open the image
+def open_image(image_path, layout=DEFAULT_LAYOUT):
+    """Open an image, converting it only when the layout cannot be hidden in its own mode."""
     image = Image.open(image_path)
-    image = image.convert('RGB')  # Ensure the image is in RGB format
-    pixels = image.load()
+    mode = carrier_mode(imagemodes.image_mode(image), layout)
+    if image.mode != mode:
+        image = image.convert(mode)
+    return image
 
-    width, height = image.size
-    pixel_count = 0
-    message_binary = ''
+def hide_message_in_image(image_path, output_path, message, layout=DEFAULT_LAYOUT, strip_rows=None):
+    if strip_rows:
+        embed_binary_in_strips(image_path, output_path, message_to_binary(message), layout, strip_rows,
+                               truncate=True)
+    else:
+        image = open_image(image_path, layout)
+
+        # Save the modified image
+        embed_message(image, message, layout).save(output_path)
+    print(f"Message hidden in {output_path}")
 
-    for y in range(height):
-        for x in range(width):
-            if pixel_count % 7 == 0:
-                r, g, b = pixels[x, y]
+def check_payload_fits(image_path, data, layout=DEFAULT_LAYOUT):
+    """Raise ValueError if data cannot fit in an image, judging from its header alone."""
+    if len(data) > file_capacity(image_path, layout):
+        raise ValueError("Payload is too large to hide in this image!")
 
-                # Extract the least significant bit of the red channel
-                message_binary += str(r & 1)
+def hide_payload_in_image(image_path, output_path, data, layout=DEFAULT_LAYOUT, strip_rows=None):
+    check_payload_fits(image_path, data, layout)  # Before any pixels are decoded
+    if strip_rows:
+        embed_binary_in_strips(image_path, output_path, bitbuffer.from_bytes(payload.frame_payload(data)),
+                               layout, strip_rows)
+    else:
+        embed_payload(open_image(image_path, layout), data, layout).save(output_path)
+    print(f"Payload of {len(data)} bytes hidden in {output_path}")
 
-            pixel_count += 1
+def extract_from_image(image_path, layout=DEFAULT_LAYOUT, strip_rows=None, fmt='auto'):
+    """Return (data, text_format) for the message or payload hidden in an image file.
 
-    # Convert the binary message to text
-    message = ''
-    for i in range(0, len(message_binary), 8):
-        byte = message_binary[i:i + 8]
-        if byte == '00000000':  # Stop at the null character
-            break
-        message += chr(int(byte, 2))
+    fmt 'auto' reads a framed payload when the hidden bits start with the
+    payload magic and a null-terminated message otherwise, in one pass, so
+    carriers made by earlier versions extract without naming their format.
+    """
+    bit_chunks = hidden_bits_in_file(image_path, layout, strip_rows)
+    if fmt == 'auto':
+        framed, bit_chunks = payload.peek_framed(bit_chunks, lambda head: b''.join(bitbuffer.iter_bytes(head)))
+        fmt = 'framed' if framed else 'text'
+    if fmt == 'text':
+        return message_from_bits(bit_chunks).encode('latin-1'), True
+    return payload.read_payload(payload.byte_reader(iter_hidden_bytes(bit_chunks))), False
+
+def extract_message_from_image(image_path, layout=DEFAULT_LAYOUT, strip_rows=None):
+    return message_from_bits(hidden_bits_in_file(image_path, layout, strip_rows))
+
+def extract_payload_from_image(image_path, layout=DEFAULT_LAYOUT, strip_rows=None):
+    bit_chunks = hidden_bits_in_file(image_path, layout, strip_rows)
+    return payload.read_payload(payload.byte_reader(iter_hidden_bytes(bit_chunks)))
+
+def batch_hide(path, timings, output_dir, data, layout=DEFAULT_LAYOUT):
+    """Batch task: hide data (a str message or framed bytes) in one carrier, saved as PNG."""
+    if not isinstance(data, str):
+        check_payload_fits(path, data, layout)
+    with batch.phase(timings, 'decode'):
+        image = open_image(path, layout)
+        image.load()
+    with batch.phase(timings, 'embed'):
+        if isinstance(data, str):
+            hidden = embed_message(image, data, layout)
+        else:
+            hidden = embed_payload(image, data, layout)
+    output = batch.output_path(output_dir, path, '.png')  # Lossless, so the hidden bits survive
+    with batch.phase(timings, 'encode'):
+        hidden.save(output)
+    return {'output': output}
+
+def batch_extract(path, timings, output_dir, fmt, layout=DEFAULT_LAYOUT):
+    """Batch task: extract the message or payload of one carrier."""
+    with batch.phase(timings, 'extract'):  # Decodes only the rows the payload covers
+        data, text_format = extract_from_image(path, layout, fmt=fmt)
+    return batch.extraction_report(path, data, text_format, output_dir, timings)
 
-    return message
+def file_capacity(path, layout=DEFAULT_LAYOUT):
+    """Return the framed payload room of an image file, reading only its header."""
+    return payload_capacity(imagemodes.header_size(path), layout)
+
+def hide_shard(job, output_dir, layout=DEFAULT_LAYOUT):
+    """Hide one (path, shard) job, saving the carrier as PNG; returns the output path."""
+    path, shard = job
+    output = batch.output_path(output_dir, path, '.png')
+    embed_payload(open_image(path, layout), shard, layout).save(output)
+    return output
+
+def extract_shard(path, layout=DEFAULT_LAYOUT):
+    """Return the shard hidden in one image."""
+    try:
+        return extract_payload_from_image(path, layout)
+    except (ValueError, OSError) as e:
+        raise ValueError(f"{path}: {e}") from None
+
+def channel_set(value):
+    """argparse type for --channels: a non-empty set of distinct letters from RGBA."""
+    value = value.upper()
+    if not value or set(value) - set(CHANNELS) or len(set(value)) != len(value):
+        raise argparse.ArgumentTypeError("channels must be distinct letters from R, G, B and A")
+    return value
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Image Steganography Tool")
     subparsers = parser.add_subparsers(dest="command", required=True)
 
+    # Options shared by both subcommands: which pixels, channels and bits carry the message
+    layout_parser = argparse.ArgumentParser(add_help=False)
+    layout_parser.add_argument("--stride", type=int, default=STRIDE,
+                               help=f"Use every Nth pixel (default: {STRIDE})")
+    layout_parser.add_argument("--channels", type=channel_set, default='R',
+                               help="Channels to use, in order, from R, G, B and A (default: R)")
+    layout_parser.add_argument("--bits", type=int, choices=range(1, payload.MAX_GROUP_BITS + 1), default=1,
+                               help="Low bits used in each channel (default: 1)")
+    layout_parser.add_argument("--key", help="Visit the pixels in an order derived from this key instead of "
+                                             "raster order; extraction needs the same key")
+
+    # Option of the single-image subcommands for carriers too large to decode at once
+    strip_parser = argparse.ArgumentParser(add_help=False)
+    strip_parser.add_argument("--strip-rows", type=int,
+                              help="Process a PNG or BMP carrier N rows at a time, keeping memory proportional "
+                                   "to the strip instead of the image (output is written as PNG)")
+
     # Subparser for hiding a message
-    hide_parser = subparsers.add_parser("hide", help="Hide a message in an image")
+    hide_parser = subparsers.add_parser("hide", parents=[layout_parser, strip_parser], help="Hide a message in an image")
     hide_parser.add_argument("input", help="Path to the input image")
     hide_parser.add_argument("output", help="Path to save the output image")
-    hide_parser.add_argument("message", help="Message to hide")
+    hide_parser.add_argument("message", nargs="?", help="Message to hide")
+    hide_parser.add_argument("--file", help="Hide the contents of this file instead of a message")
+    hide_parser.add_argument("--format", choices=["framed", "text"], default="framed",
+                             help="framed: length-prefixed payload with a checksum (default); "
+                                  "text: null-terminated message as in earlier versions")
 
     # Subparser for extracting a message
-    extract_parser = subparsers.add_parser("extract", help="Extract a message from an image")
+    extract_parser = subparsers.add_parser("extract", parents=[layout_parser, strip_parser],
+                                           help="Extract a message from an image")
     extract_parser.add_argument("input", help="Path to the image to extract the message from")
+    extract_parser.add_argument("--format", choices=["auto", "framed", "text"], default="auto",
+                                help="Format the message was hidden with (default: auto, framed when the "
+                                     "carrier holds a framed payload and text otherwise)")
+    extract_parser.add_argument("--output", help="Write the extracted payload to this file")
+
+    # Subparser for running hide or extract over many images
+    batch_parser = subparsers.add_parser("batch", parents=[layout_parser],
+                                         help="Hide or extract in every image of a directory or manifest, "
+                                              "printing one JSON line per image")
+    batch.add_batch_arguments(batch_parser)
+
+    # Subparsers for payloads split across several images
+    shard_parser = subparsers.add_parser("shard", parents=[layout_parser],
+                                         help="Split a payload across several images")
+    unshard_parser = subparsers.add_parser("unshard", parents=[layout_parser],
+                                           help="Reassemble a payload from its sharded images")
+    batch.add_shard_arguments(shard_parser, unshard_parser)
+
+    # Subparser for sizing carriers without decoding them
+    capacity_parser = subparsers.add_parser("capacity", parents=[layout_parser],
+                                            help="Report how many payload bytes each image holds")
+    capacity_parser.add_argument("carriers", nargs="+", help="Images, or directories of images")
 
     args = parser.parse_args()
+    if args.stride < 1:
+        parser.error("--stride must be at least 1")
+    if getattr(args, "strip_rows", None) is not None and args.strip_rows < 1:
+        parser.error("--strip-rows must be at least 1")
+    if args.key is not None and getattr(args, "strip_rows", None):
+        parser.error("--key cannot be combined with --strip-rows")
+    layout = Layout(args.stride, args.channels, args.bits, args.key)
 
-    if args.command == "hide":
-        hide_message_in_image(args.input, args.output, args.message)
-    elif args.command == "extract":
-        extracted_message = extract_message_from_image(args.input)
-        print(f"Extracted Message: {extracted_message}")
+    try:
+        if args.command == "batch":
+            data = batch.prepare_batch(parser, args)
+            if args.action == "hide":
+                task = partial(batch_hide, output_dir=args.output_dir, data=data, layout=layout)
+            else:
+                task = partial(batch_extract, output_dir=args.output_dir, fmt=args.format, layout=layout)
+            sys.exit(1 if batch.run_batch(task, args.source, args.jobs, args.output_dir) else 0)
+        elif args.command == "capacity":
+            sys.exit(1 if batch.report_capacities(args.carriers, partial(file_capacity, layout=layout)) else 0)
+        elif args.command == "shard":
+            os.makedirs(args.output_dir, exist_ok=True)
+            data = batch.shard_data(args)
+            for output in batch.hide_shards(data, args.carriers, partial(file_capacity, layout=layout),
+                                            partial(hide_shard, output_dir=args.output_dir, layout=layout),
+                                            args.jobs):
+                print(f"Shard hidden in {output}")
+        elif args.command == "unshard":
+            data = batch.extract_shards(args.carriers, partial(extract_shard, layout=layout), args.jobs)
+            batch.report_unshard(data, args.output)
+        elif args.command == "hide":
+            if (args.message is None) == (args.file is None):
+                parser.error("hide needs either a message or --file")
+            if args.format == "text":
+                if args.file is not None:
+                    parser.error("--file needs the framed format")
+                hide_message_in_image(args.input, args.output, args.message, layout, args.strip_rows)
+            else:
+                if args.file is not None:
+                    with open(args.file, 'rb') as f:
+                        data = f.read()
+                else:
+                    data = args.message.encode('utf-8')
+                hide_payload_in_image(args.input, args.output, data, layout, args.strip_rows)
+        elif args.command == "extract":
+            data, text_format = extract_from_image(args.input, layout, args.strip_rows, args.format)
+            if args.output:
+                with open(args.output, 'wb') as f:
+                    f.write(data)
+                print(f"Extracted {len(data)} bytes to {args.output}")
+            elif text_format:
+                print(f"Extracted Message: {data.decode('latin-1')}")
+            else:
+                print(f"Extracted Message: {data.decode('utf-8', errors='replace')}")
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
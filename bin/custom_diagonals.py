@@ -1,108 +1,258 @@
 #!/usr/bin/env python3
 
+import argparse
+import os
+import sys
+from functools import partial
+
 from PIL import Image
 
-# Function to read an image and extract pixel data
+import batch
+import bitbuffer
+import imagemodes
+import payload
+import pixelplans
+
+# Default pixel order: all wrapped diagonals, which start with the main diagonal earlier versions used
+DEFAULT_SCHEME = 'wrapped'
+
+# Function to read an image and extract pixel data, in its own mode when it is L, LA, P (without transparency), RGB or RGBA
 def read_image(file_path):
     with Image.open(file_path) as img:
-        return img.convert('RGB'), img.size
+        mode = imagemodes.image_mode(img)
+        if img.mode != mode:
+            return img.convert(mode), img.size
+        img.load()
+        return img, img.size
 
 # Function to save the modified image
 def save_image(file_path, img):
     img.save(file_path)
 
-# Function to calculate diagonal pixel indices in the image
-def calculate_diagonal_indices(width, height):
-    indices = []
-    for i in range(min(width, height)):
-        indices.append(i * (width + 1))  # Diagonal index formula for linearized array
-    return indices
+# Function to get the plan of the pixels that carry the bits, as ranges of (row * width + col) indices
+def calculate_diagonal_indices(width, height, scheme=DEFAULT_SCHEME):
+    return pixelplans.index_plan(width, height, scheme)
 
-# Function to hide a message in the diagonal pixels of the image
-def hide_message_diagonal(img, message, width, height):
-    message += "\0"  # Null terminator to mark end of the message
-    binary_message = ''.join(f"{ord(c):08b}" for c in message)  # Convert message to binary
+# Function to hide the bits of a BitBuffer in the diagonal pixels of the image
+def hide_binary_diagonal(img, bits, width, height, scheme=DEFAULT_SCHEME):
+    if bits.length > pixelplans.plan_length(width, height, scheme):
+        raise ValueError("Message is too large to hide in the diagonal pixels of this image!")
 
-    diagonal_indices = calculate_diagonal_indices(width, height)
+    if img.mode == 'P':
+        img = imagemodes.sort_palette(img)  # So a changed index shows a similar colour
+    raw = bytearray(img.tobytes())
+    plan = pixelplans.plan_prefix(calculate_diagonal_indices(width, height, scheme), bits.length)
+    pixel_size = imagemodes.pixel_size(img.mode)
 
-    if len(binary_message) > len(diagonal_indices):
-        raise ValueError("Message is too large to hide in the diagonal pixels of this image!")
+    # Gather the first byte (red, gray level or palette index) of every pixel used, set all their LSBs at once
+    values = pixelplans.gather(raw, plan, pixel_size)
+    pixelplans.scatter(raw, plan, pixel_size, payload.embed_bits(values, bitbuffer.unpack(bits)))
+    return imagemodes.replace_pixels(img, raw)
+
+# Function to hide a message in the diagonal pixels of the image
+def hide_message_diagonal(img, message, width, height, scheme=DEFAULT_SCHEME):
+    message += "\0"  # Null terminator to mark end of the message
+    return hide_binary_diagonal(img, bitbuffer.from_text(message), width, height, scheme)
 
-    pixels = img.load()  # Access image pixel data
-    for i, bit in enumerate(binary_message):
-        x, y = divmod(diagonal_indices[i], width)  # Convert the linear index to 2D coordinates
-        r, g, b = pixels[x, y]
-        new_pixel = (r & ~1 | int(bit), g, b)  # Modify only the LSB of the red channel
-        pixels[x, y] = new_pixel  # Update the pixel
+# Function to hide arbitrary bytes as a framed payload in the diagonal pixels
+def hide_payload_diagonal(img, data, width, height, scheme=DEFAULT_SCHEME):
+    if len(data) > payload_capacity(width, height, scheme):
+        raise ValueError("Payload is too large to hide in the diagonal pixels of this image!")
+    return hide_binary_diagonal(img, bitbuffer.from_bytes(payload.frame_payload(data)), width, height, scheme)
 
-    return img
+# Function to yield the hidden bytes along the plan, a chunk of pixels at a time
+def iter_diagonal_bytes(img, width, height, scheme=DEFAULT_SCHEME):
+    raw = img.tobytes()
+    pixel_size = imagemodes.pixel_size(img.mode)
+    chunks = pixelplans.iter_chunks(calculate_diagonal_indices(width, height, scheme))
+    # Bytes split between two chunks are carried over; leftover bits at the end of the plan are dropped
+    yield from bitbuffer.iter_bytes(bitbuffer.pack(pixelplans.gather(raw, chunk, pixel_size)) for chunk in chunks)
 
 # Function to extract a hidden message from the diagonal pixels of the image
-def extract_message_diagonal(img, width, height):
-    diagonal_indices = calculate_diagonal_indices(width, height)
-    binary_message = []
-
-    pixels = img.load()  # Access image pixel data
-    for index in diagonal_indices:
-        x, y = divmod(index, width)  # Convert the linear index to 2D coordinates
-        r, g, b = pixels[x, y]
-        binary_message.append(str(r & 1))  # Get the LSB from the red channel
-
-        # Check for null terminator every 8 bits
-        if len(binary_message) >= 8 and ''.join(binary_message[-8:]) == "00000000":
+def extract_message_diagonal(img, width, height, verbose=True, scheme=DEFAULT_SCHEME):
+    message = bytearray()
+    terminated = False
+    for data in iter_diagonal_bytes(img, width, height, scheme):
+        end = data.find(0)  # Stop at the null terminator
+        if end >= 0:
+            message += data[:end]
+            terminated = True
             break
+        message += data
 
-    print('Binary message:', ''.join(binary_message))  # This will print the raw binary message
+    if verbose:
+        # Print the raw binary message, up to and including the terminator
+        print('Binary message:', bitbuffer.to_string(bitbuffer.from_bytes(bytes(message) + b'\0' * terminated)))
 
-    # Convert binary to text
-    message = ''
-    byte_str = ''.join(binary_message)
-    for i in range(0, len(byte_str), 8):
-        byte = byte_str[i:i+8]
-        if len(byte) < 8:  # In case of leftover bits
-            break
-        # Check for null terminator
-        if byte == "00000000":
-            break
-        message += chr(int(byte, 2))
+    return message.decode('latin-1')
 
-    return message
+# Function to extract a framed payload, reading only the pixels it covers
+def extract_payload_diagonal(img, width, height, scheme=DEFAULT_SCHEME):
+    return payload.read_payload(payload.byte_reader(iter_diagonal_bytes(img, width, height, scheme)))
+
+# Function to tell whether the diagonal pixels hold a framed payload, reading only the first chunk
+def holds_framed_payload(img, width, height, scheme=DEFAULT_SCHEME):
+    return payload.peek_framed(iter_diagonal_bytes(img, width, height, scheme))[0]
+
+# Function to extract in the given format, with auto reading a framed payload when there is one and a
+# null-terminated message otherwise; returns (data, text_format)
+def extract_diagonal(img, width, height, fmt='auto', verbose=True, scheme=DEFAULT_SCHEME):
+    if fmt == 'auto':
+        fmt = 'framed' if holds_framed_payload(img, width, height, scheme) else 'text'
+    if fmt == 'text':
+        return extract_message_diagonal(img, width, height, verbose, scheme).encode('latin-1'), True
+    return extract_payload_diagonal(img, width, height, scheme), False
+
+# Function to check, from the image header alone, that a framed payload fits
+def check_payload_fits(path, data, scheme=DEFAULT_SCHEME):
+    if len(data) > file_capacity(path, scheme):
+        raise ValueError("Payload is too large to hide in the diagonal pixels of this image!")
+
+# Batch task: hide data (a str message or framed bytes) in one carrier, saved as PNG
+def batch_hide(path, timings, output_dir, data, scheme=DEFAULT_SCHEME):
+    if not isinstance(data, str):
+        check_payload_fits(path, data, scheme)  # Before any pixels are decoded
+    with batch.phase(timings, 'decode'):
+        img, (width, height) = read_image(path)
+    with batch.phase(timings, 'embed'):
+        if isinstance(data, str):
+            modified_img = hide_message_diagonal(img, data, width, height, scheme)
+        else:
+            modified_img = hide_payload_diagonal(img, data, width, height, scheme)
+    output = batch.output_path(output_dir, path, '.png')  # Lossless, so the hidden bits survive
+    with batch.phase(timings, 'encode'):
+        save_image(output, modified_img)
+    return {'output': output}
+
+# Batch task: extract the message or payload of one carrier
+def batch_extract(path, timings, output_dir, fmt, scheme=DEFAULT_SCHEME):
+    with batch.phase(timings, 'decode'):
+        img, (width, height) = read_image(path)
+    with batch.phase(timings, 'extract'):
+        data, text_format = extract_diagonal(img, width, height, fmt, verbose=False, scheme=scheme)
+    return batch.extraction_report(path, data, text_format, output_dir, timings)
+
+# Function to get the framed payload room of an image of the given size
+def payload_capacity(width, height, scheme=DEFAULT_SCHEME):
+    return payload.max_payload(pixelplans.plan_length(width, height, scheme) // 8)  # One bit per pixel visited
+
+# Function to get the framed payload room of an image file, reading only its header
+def file_capacity(path, scheme=DEFAULT_SCHEME):
+    return payload_capacity(*imagemodes.header_size(path), scheme)
+
+# Function to hide one (path, shard) job, saving the carrier as PNG
+def hide_shard(job, output_dir, scheme=DEFAULT_SCHEME):
+    path, shard = job
+    img, (width, height) = read_image(path)
+    output = batch.output_path(output_dir, path, '.png')
+    save_image(output, hide_payload_diagonal(img, shard, width, height, scheme))
+    return output
+
+# Function to extract the shard hidden in one image
+def extract_shard(path, scheme=DEFAULT_SCHEME):
+    try:
+        img, (width, height) = read_image(path)
+        return extract_payload_diagonal(img, width, height, scheme)
+    except (ValueError, OSError) as e:
+        raise ValueError(f"{path}: {e}") from None
 
 # Main program
 if __name__ == "__main__":
-    import sys
+    parser = argparse.ArgumentParser(description="Diagonal Image Steganography Tool")
+    subparsers = parser.add_subparsers(dest="command", required=True)
 
-    if len(sys.argv) < 4:
-        print("Usage: custom_diagonals.py <hide/extract> <input_file> <output_file/message>")
-        sys.exit(1)
+    # Option shared by every subcommand: the order of the pixels that carry the bits
+    scheme_parser = argparse.ArgumentParser(add_help=False)
+    scheme_parser.add_argument("--scheme", choices=pixelplans.SCHEMES, default=DEFAULT_SCHEME,
+                               help="Pixel order: main or anti diagonal only, or every pixel along "
+                                    f"wrapped diagonals, a spiral or a zig-zag (default: {DEFAULT_SCHEME})")
+
+    # Subparser for hiding a message
+    hide_parser = subparsers.add_parser("hide", parents=[scheme_parser], help="Hide a message in the diagonal of an image")
+    hide_parser.add_argument("input", help="Path to the input image")
+    hide_parser.add_argument("output", help="Path to save the output image")
+    hide_parser.add_argument("message", nargs="?", help="Message to hide")
+    hide_parser.add_argument("--file", help="Hide the contents of this file instead of a message")
+    hide_parser.add_argument("--format", choices=["framed", "text"], default="framed",
+                             help="framed: length-prefixed payload with a checksum (default); "
+                                  "text: null-terminated message as in earlier versions")
 
-    action, input_file = sys.argv[1], sys.argv[2]
-    output_file_or_message = sys.argv[3]
+    # Subparser for extracting a message
+    extract_parser = subparsers.add_parser("extract", parents=[scheme_parser], help="Extract a message from the diagonal of an image")
+    extract_parser.add_argument("input", help="Path to the image to extract the message from")
+    extract_parser.add_argument("--format", choices=["auto", "framed", "text"], default="auto",
+                                help="Format the message was hidden with (default: auto, framed when the "
+                                     "carrier holds a framed payload and text otherwise)")
+    extract_parser.add_argument("--output", help="Write the extracted payload to this file")
 
-    # Read image data
-    img, (width, height) = read_image(input_file)
+    # Subparser for running hide or extract over many images
+    batch_parser = subparsers.add_parser("batch", parents=[scheme_parser], help="Hide or extract in every image of a directory or manifest, "
+                                                       "printing one JSON line per image")
+    batch.add_batch_arguments(batch_parser)
 
-    if action == "hide":
-        if len(sys.argv) != 5:
-            print("Usage: custom_diagonals.py hide <input_file> <output_file> <message>")
-            sys.exit(1)
+    # Subparsers for payloads split across several images
+    shard_parser = subparsers.add_parser("shard", parents=[scheme_parser], help="Split a payload across the diagonals of several images")
+    unshard_parser = subparsers.add_parser("unshard", parents=[scheme_parser], help="Reassemble a payload from its sharded images")
+    batch.add_shard_arguments(shard_parser, unshard_parser)
 
-        output_file = sys.argv[3]
-        message = sys.argv[4]
+    # Subparser for sizing carriers without decoding them
+    capacity_parser = subparsers.add_parser("capacity", parents=[scheme_parser], help="Report how many payload bytes each image holds")
+    capacity_parser.add_argument("carriers", nargs="+", help="Images, or directories of images")
 
-        # Hide message in image
-        try:
-            modified_img = hide_message_diagonal(img, message, width, height)
-            save_image(output_file, modified_img)
-            print(f"Message hidden successfully in {output_file}.")
-        except ValueError as e:
-            print(f"Error: {e}")
+    args = parser.parse_args()
 
-    elif action == "extract":
-        # Extract hidden message from image
-        message = extract_message_diagonal(img, width, height)
-        print(f"Extracted message: {message}")
+    try:
+        if args.command == "batch":
+            data = batch.prepare_batch(parser, args)
+            if args.action == "hide":
+                task = partial(batch_hide, output_dir=args.output_dir, data=data, scheme=args.scheme)
+            else:
+                task = partial(batch_extract, output_dir=args.output_dir, fmt=args.format, scheme=args.scheme)
+            sys.exit(1 if batch.run_batch(task, args.source, args.jobs, args.output_dir) else 0)
+        elif args.command == "capacity":
+            sys.exit(1 if batch.report_capacities(args.carriers, partial(file_capacity, scheme=args.scheme)) else 0)
+        elif args.command == "shard":
+            os.makedirs(args.output_dir, exist_ok=True)
+            data = batch.shard_data(args)
+            for output in batch.hide_shards(data, args.carriers, partial(file_capacity, scheme=args.scheme),
+                                            partial(hide_shard, output_dir=args.output_dir, scheme=args.scheme),
+                                            args.jobs):
+                print(f"Shard hidden in {output}")
+        elif args.command == "unshard":
+            data = batch.extract_shards(args.carriers, partial(extract_shard, scheme=args.scheme), args.jobs)
+            batch.report_unshard(data, args.output)
+        elif args.command == "hide":
+            if (args.message is None) == (args.file is None):
+                parser.error("hide needs either a message or --file")
+            # Hide message in image
+            if args.format == "text":
+                if args.file is not None:
+                    parser.error("--file needs the framed format")
+                img, (width, height) = read_image(args.input)
+                modified_img = hide_message_diagonal(img, args.message, width, height, args.scheme)
+            else:
+                if args.file is not None:
+                    with open(args.file, 'rb') as f:
+                        data = f.read()
+                else:
+                    data = args.message.encode('utf-8')
+                check_payload_fits(args.input, data, args.scheme)
+                img, (width, height) = read_image(args.input)
+                modified_img = hide_payload_diagonal(img, data, width, height, args.scheme)
+            save_image(args.output, modified_img)
+            print(f"Message hidden successfully in {args.output}.")
 
-    else:
-        print("Invalid action. Use 'hide' or 'extract'.")
+        elif args.command == "extract":
+            # Extract hidden message from image
+            img, (width, height) = read_image(args.input)
+            data, text_format = extract_diagonal(img, width, height, args.format, scheme=args.scheme)
+            message = data.decode('latin-1') if text_format else data.decode('utf-8', errors='replace')
+            if args.output:
+                with open(args.output, 'wb') as f:
+                    f.write(data)
+                print(f"Extracted {len(data)} bytes to {args.output}")
+            else:
+                print(f"Extracted message: {message}")
+    except ValueError as e:
+        print(f"Error: {e}")
         sys.exit(1)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+# Image modes the steganography tools embed in natively, without an RGB
+# conversion: grayscale levels, palette indices and RGB(A) channels are all
+# one byte per channel, so the hidden bits go straight into them and the
+# output keeps the carrier's mode, alpha and file size. P images with
+# transparency are the exception: see image_mode.
+
+from PIL import Image, ImageMode
+
+NATIVE_MODES = ('L', 'LA', 'P', 'RGB', 'RGBA')
+
+def native_mode(mode):
+    """Return the mode an image of `mode` is handled in: itself if native, else RGB or RGBA."""
+    if mode in NATIVE_MODES:
+        return mode
+    return 'RGBA' if 'A' in ImageMode.getmode(mode).bands else 'RGB'
+
+def image_mode(image):
+    """Return the mode an image is handled in: native_mode of its mode, but RGBA for a P image with transparency.
+
+    Changing the low bits of a palette index moves a pixel to a neighbouring
+    entry, which may be transparent where the original entry is opaque or
+    the other way round. In RGBA the hidden bits go into the colours alone
+    and the alpha stays as it was.
+    """
+    if image.mode == 'P' and 'transparency' in image.info:
+        return 'RGBA'
+    return native_mode(image.mode)
+
+def pixel_size(mode):
+    """Return the number of bytes per pixel of a native mode."""
+    return Image.getmodebands(mode)
+
+def header_size(path):
+    """Return the (width, height) of an image file, reading only its header.
+
+    No pixels are decoded, so Pillow's decompression bomb check, which
+    guards full decodes, is lifted for this open: the gigapixel carriers
+    the strip path handles are sized like any other.
+    """
+    limit, Image.MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS, None
+    try:
+        with Image.open(path) as image:
+            return image.size
+    finally:
+        Image.MAX_IMAGE_PIXELS = limit
+
+def sort_palette(image):
+    """Return a P image with its palette sorted by brightness and padded to 256 entries.
+
+    Neighbouring indices then hold similar shades, so changing the low bits
+    of an index swaps a pixel's colour for a close one, and no changed index
+    points past the end of the palette. The colours shown do not change.
+    """
+    palette = image.getpalette('RGB')
+    count = len(palette) // 3
+    # ITU-R BT.601 luma, the weights Pillow itself uses for grayscale conversion
+    order = sorted(range(count), key=lambda i: (299 * palette[3 * i] + 587 * palette[3 * i + 1]
+                                                + 114 * palette[3 * i + 2], i))
+    image = image.remap_palette(order)
+    palette = image.getpalette('RGB')
+    image.putpalette(palette + palette[-3:] * (256 - count))
+    return image
+
+def replace_pixels(image, raw):
+    """Return a new image like image, but with the pixel bytes raw.
+
+    The palette of a P image and the image info (transparency, colour
+    profile) carry over, so the result saves like the original.
+    """
+    result = Image.frombytes(image.mode, image.size, bytes(raw))
+    if image.mode == 'P':
+        result.putpalette(image.getpalette('RGB'))
+    result.info = dict(image.info)
+    return result
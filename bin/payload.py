@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+# Length-prefixed payload framing shared by the LSB steganography tools.
+#
+# A framed payload is laid out as:
+#   magic (4 bytes) | length (varint) | CRC-32 of the data (4 bytes, little-endian) | data
+# so an extractor reads the header, then exactly `length` bytes, and can
+# reject a carrier holding no payload after its first four bytes.
+#
+# A payload too large for one carrier is split into shards. Each shard is a
+# framed payload of its own (so every shard carries its own CRC) whose data
+# starts with a shard header:
+#   set id (8 bytes) | index | count | total size | CRC-32 of the whole payload
+
+import itertools
+import os
+import struct
+import zlib
+
+PAYLOAD_MAGIC = b'LSB\x01'
+MAX_VARINT_BYTES = 10  # Enough for any 64-bit length
+CRC_FORMAT = '<I'
+SHARD_FORMAT = '<8sIIQI'
+SHARD_HEADER_SIZE = struct.calcsize(SHARD_FORMAT)
+
+MAX_GROUP_BITS = 4  # Most low bits of a carrier byte a payload may use
+
+# Translation tables for carrier bytes handled a whole buffer at a time:
+# CLEAR_LOW_BITS[k] clears the k low bits of a byte
+CLEAR_LOW_BITS = [bytes(v & ~((1 << k) - 1) for v in range(256)) for k in range(MAX_GROUP_BITS + 1)]
+
+def encode_varint(value):
+    """Encode a non-negative integer as a little-endian base-128 varint."""
+    encoded = bytearray()
+    while value > 0x7F:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return encoded
+
+def frame_payload(data):
+    """Return data with the payload header in front of it."""
+    return PAYLOAD_MAGIC + encode_varint(len(data)) + struct.pack(CRC_FORMAT, zlib.crc32(data)) + data
+
+def max_payload(capacity):
+    """Return the largest data length whose framed payload fits in capacity bytes.
+
+    Returns -1 when not even the header of an empty payload fits, so such a
+    carrier is not mistaken for one holding an empty payload.
+    """
+    if framed_size(0) > capacity:
+        return -1
+    length = capacity - framed_size(0)
+    while length and framed_size(length) > capacity:
+        length -= 1
+    return length
+
+def split_shards(data, capacities):
+    """Split data into shards for carriers that hold capacities[i] bytes of framed payload each.
+
+    Carriers are filled in order. Returns a list parallel to capacities
+    holding each carrier's shard, or None for carriers that are not needed
+    or too small to hold a shard header.
+    """
+    rooms = [capacity - SHARD_HEADER_SIZE for capacity in capacities]
+    chunks = []
+    pos = 0
+    for room in rooms:
+        if room < 0 or (pos >= len(data) and chunks):
+            chunks.append(None)
+            continue
+        chunks.append(data[pos:pos + room])
+        pos += room
+    if pos < len(data) or not any(chunk is not None for chunk in chunks):
+        usable = sum(room for room in rooms if room > 0)
+        raise ValueError(f"Payload of {len(data)} bytes does not fit in these carriers, "
+                         f"which hold {usable} bytes of shards!")
+
+    set_id = os.urandom(8)  # Tells shards of different payloads apart
+    count = sum(chunk is not None for chunk in chunks)
+    crc = zlib.crc32(data)
+    shards = []
+    index = 0
+    for chunk in chunks:
+        if chunk is None:
+            shards.append(None)
+            continue
+        shards.append(struct.pack(SHARD_FORMAT, set_id, index, count, len(data), crc) + chunk)
+        index += 1
+    return shards
+
+def join_shards(shards):
+    """Reassemble a payload from its shards, given in any order.
+
+    Raises ValueError if the shards belong to different payloads, if any is
+    missing, or if the result does not match the payload's size and CRC.
+    """
+    parts = {}
+    header = None
+    for shard in shards:
+        if len(shard) < SHARD_HEADER_SIZE:
+            raise ValueError("Carrier holds a payload that is not a shard!")
+        set_id, index, count, size, crc = struct.unpack_from(SHARD_FORMAT, shard)
+        if header is None:
+            header = (set_id, count, size, crc)
+        elif header != (set_id, count, size, crc):
+            raise ValueError("Shards come from different payloads!")
+        if index >= count or parts.setdefault(index, shard) != shard:
+            raise ValueError(f"Shard {index} is invalid or conflicts with another copy!")
+    if header is None:
+        raise ValueError("No shards to join!")
+
+    _, count, size, crc = header
+    missing = [index for index in range(count) if index not in parts]
+    if missing:
+        raise ValueError(f"Missing shards {', '.join(map(str, missing))} of {count}!")
+    data = b''.join(parts[index][SHARD_HEADER_SIZE:] for index in range(count))
+    if len(data) != size or zlib.crc32(data) != crc:
+        raise ValueError("Reassembled payload does not match its checksum!")
+    return data
+
+def framed_size(length):
+    """Return the number of bytes a framed payload of `length` data bytes takes."""
+    return len(PAYLOAD_MAGIC) + len(encode_varint(length)) + struct.calcsize(CRC_FORMAT) + length
+
+def read_exactly(read, size, what):
+    """Read size bytes through read(n), raising ValueError if the carrier runs out."""
+    data = read(size)
+    if len(data) < size:
+        raise ValueError(f"Carrier ends before the {what} is complete!")
+    return data
+
+def read_payload(read):
+    """Read a framed payload through read(n), which returns the next n hidden bytes.
+
+    Only the header and then the announced number of bytes are requested,
+    so the caller never extracts more of the carrier than the payload uses.
+    """
+    if read(len(PAYLOAD_MAGIC)) != PAYLOAD_MAGIC:
+        raise ValueError("No hidden payload found in this carrier!")
+
+    length = 0
+    for shift in range(0, 7 * MAX_VARINT_BYTES, 7):
+        byte = read_exactly(read, 1, "payload header")[0]
+        length |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+    else:
+        raise ValueError("Payload header is corrupt!")
+
+    crc, = struct.unpack(CRC_FORMAT, read_exactly(read, struct.calcsize(CRC_FORMAT), "payload header"))
+    data = read_exactly(read, length, "payload")
+    if zlib.crc32(data) != crc:
+        raise ValueError("Payload checksum does not match, the carrier is damaged!")
+    return data
+
+def peek_framed(chunks, to_bytes=b''.join):
+    """Look at the start of a stream of hidden chunks, returning (framed, chunks).
+
+    framed tells whether the stream starts with the payload magic, so an
+    extractor can fall back to the null-terminated format of earlier
+    versions. The chunks returned yield the whole stream again, those
+    looked at included. to_bytes turns a list of chunks into hidden bytes.
+    """
+    chunks = iter(chunks)
+    head = []
+    data = b''
+    while len(data) < len(PAYLOAD_MAGIC):
+        chunk = next(chunks, None)
+        if chunk is None:
+            break
+        head.append(chunk)
+        data = to_bytes(head)
+    return data[:len(PAYLOAD_MAGIC)] == PAYLOAD_MAGIC, itertools.chain(head, chunks)
+
+def byte_reader(chunks):
+    """Turn an iterable of byte chunks into a read(n) function over their concatenation."""
+    chunks = iter(chunks)
+    buffer = bytearray()
+
+    def read(size):
+        while len(buffer) < size:
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            buffer.extend(chunk)
+        data = bytes(buffer[:size])
+        del buffer[:size]
+        return data
+
+    return read
+
+def embed_bits(values, bits, count=1):
+    """Set the `count` low bits of each byte in values to the byte at the same position in bits."""
+    cleared = values.translate(CLEAR_LOW_BITS[count])
+    # OR-ing the two buffers as big integers sets every bit in one C-level operation
+    merged = int.from_bytes(cleared, 'big') | int.from_bytes(bits, 'big')
+    return merged.to_bytes(len(values), 'big')
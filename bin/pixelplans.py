@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+# Pixel visiting orders ("plans") for the diagonal steganography tool.
+#
+# A plan lists the linear indices (row * width + col) of the pixels that
+# carry the hidden bits, in order. It is stored as a tuple of ranges, one
+# per straight stretch of the path, so even a plan covering every pixel of
+# a large image takes a few thousand small objects instead of one entry per
+# pixel. Each range maps onto an extended slice of the raw pixel bytes, so
+# the carrier bytes of a whole stretch are gathered or scattered in one
+# C-level slice. Plans depend only on the image size and scheme and are
+# cached, so a batch over same-sized images builds each plan once.
+
+import functools
+
+PLAN_CACHE_SIZE = 32   # Plans kept per process, one per (width, height, scheme)
+CHUNK_PIXELS = 4096    # Pixels read per step when extracting along a plan
+
+def progression(start, step, count):
+    """Return the range of `count` indices from start in steps of step."""
+    step = step or 1  # A single-index stretch has no step of its own
+    return range(start, start + step * count, step)
+
+def main_diagonal(width, height):
+    """The diagonal from the top-left corner: min(width, height) pixels."""
+    return [progression(0, width + 1, min(width, height))]
+
+def anti_diagonal(width, height):
+    """The diagonal from the top-right corner: min(width, height) pixels."""
+    return [progression(width - 1, width - 1, min(width, height))]
+
+def wrapped_diagonals(width, height):
+    """Every pixel, one wrapped diagonal at a time.
+
+    Diagonal d holds the pixels at (row, (row + d) % width) for every row,
+    so the width diagonals together cover the image. The path starts with
+    the main diagonal, which is what earlier versions used on their own.
+    """
+    segments = []
+    for d in range(width):
+        row = 0
+        while row < height:
+            col = (row + d) % width
+            count = min(width - col, height - row)  # Until the column wraps or the rows run out
+            segments.append(progression(row * width + col, width + 1, count))
+            row += count
+    return segments
+
+def spiral(width, height):
+    """Every pixel, clockwise from the top-left corner inwards."""
+    segments = []
+    top, left, bottom, right = 0, 0, height - 1, width - 1
+    while top <= bottom and left <= right:
+        segments.append(progression(top * width + left, 1, right - left + 1))  # Top row, rightwards
+        if top < bottom:
+            segments.append(progression((top + 1) * width + right, width, bottom - top))  # Right column, down
+            if left < right:
+                segments.append(progression(bottom * width + right - 1, -1, right - left))  # Bottom row, leftwards
+                if bottom - top > 1:
+                    segments.append(progression((bottom - 1) * width + left, -width, bottom - top - 1))  # Left column, up
+        top, left, bottom, right = top + 1, left + 1, bottom - 1, right - 1
+    return segments
+
+def zigzag(width, height):
+    """Every pixel, along alternating anti-diagonals as in a JPEG zig-zag scan."""
+    segments = []
+    for s in range(width + height - 1):
+        first_row, last_row = max(0, s - width + 1), min(s, height - 1)
+        count = last_row - first_row + 1
+        if s % 2:
+            segments.append(progression(first_row * width + s - first_row, width - 1, count))  # Down and left
+        else:
+            segments.append(progression(last_row * width + s - last_row, -(width - 1), count))  # Up and right
+    return segments
+
+PLANS = {
+    'main': main_diagonal,
+    'anti': anti_diagonal,
+    'wrapped': wrapped_diagonals,
+    'spiral': spiral,
+    'zigzag': zigzag,
+}
+SCHEMES = tuple(PLANS)
+
+@functools.lru_cache(maxsize=PLAN_CACHE_SIZE)
+def index_plan(width, height, scheme):
+    """Return the plan of a scheme for an image of the given size, as a tuple of ranges."""
+    return tuple(PLANS[scheme](width, height))
+
+def plan_length(width, height, scheme):
+    """Return how many pixels a scheme's plan visits, without building it."""
+    if scheme in ('main', 'anti'):
+        return min(width, height)
+    return width * height
+
+def plan_prefix(plan, count):
+    """Return the ranges covering the first `count` indices of a plan."""
+    prefix = []
+    for indices in plan:
+        if count <= 0:
+            break
+        prefix.append(indices[:count])
+        count -= len(indices)
+    return prefix
+
+def iter_chunks(plan, pixels=CHUNK_PIXELS):
+    """Yield the plan in consecutive groups of ranges covering at least `pixels` indices each."""
+    group, size = [], 0
+    for indices in plan:
+        group.append(indices)
+        size += len(indices)
+        if size >= pixels:
+            yield group
+            group, size = [], 0
+    if group:
+        yield group
+
+def byte_slice(indices, pixel_size, offset=0):
+    """Return the slice of raw pixel bytes holding byte `offset` of each pixel in a range."""
+    start = indices.start * pixel_size + offset
+    step = indices.step * pixel_size
+    stop = start + len(indices) * step
+    return slice(start, stop if stop >= 0 else None, step)
+
+def gather(raw, plan, pixel_size, offset=0):
+    """Return byte `offset` of every pixel a plan visits, in plan order."""
+    return b''.join(raw[byte_slice(indices, pixel_size, offset)] for indices in plan)
+
+def scatter(raw, plan, pixel_size, values, offset=0):
+    """Write bytes gathered along a plan back into raw, a bytearray."""
+    pos = 0
+    for indices in plan:
+        raw[byte_slice(indices, pixel_size, offset)] = values[pos:pos + len(indices)]
+        pos += len(indices)
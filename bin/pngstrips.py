@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+# Strip-wise PNG reading and writing, so huge carriers can be processed a
+# band of rows at a time with memory bounded by the band size, and a short
+# payload near the top can be read without decoding the rest.
+#
+# Reading inflates the IDAT stream incrementally and hands each band of
+# filtered scanlines to Pillow as a small PNG of its own, so the row filters
+# are still undone in C. Bands after the first are prefixed with the last
+# row of the band before, stored unfiltered, because the Up, Average and
+# Paeth filters refer to the previous row.
+#
+# Writing filters every row with Up (computed by Pillow as a modulo
+# subtraction against the image shifted down one row) and deflates the rows
+# as they arrive.
+
+import io
+import struct
+import zlib
+
+from PIL import Image, ImageChops
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+IHDR_FORMAT = '>IIBBBBB'
+READ_SIZE = 1024 * 1024  # Compressed bytes read, and inflated bytes produced, per step
+IDAT_SIZE = 256 * 1024   # Target size of the IDAT chunks written
+FILTER_NONE = 0
+FILTER_UP = 2
+
+# PNG colour types handled in strips, by Pillow mode
+COLOR_TYPES = {'L': 0, 'RGB': 2, 'LA': 4, 'RGBA': 6}
+MODES = {color_type: mode for mode, color_type in COLOR_TYPES.items()}
+
+def chunk(chunk_type, data):
+    """Return a complete PNG chunk: length, type, data and CRC."""
+    crc = zlib.crc32(data, zlib.crc32(chunk_type))
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', crc)
+
+def png_header(size, mode):
+    """Return the signature and IHDR chunk of a non-interlaced 8-bit PNG."""
+    width, height = size
+    return PNG_SIGNATURE + chunk(b'IHDR', struct.pack(IHDR_FORMAT, width, height, 8, COLOR_TYPES[mode], 0, 0, 0))
+
+def read_header(f):
+    """Read the signature and IHDR of a PNG, returning ((width, height), mode).
+
+    Raises ValueError for anything but a non-interlaced 8-bit L, LA, RGB or
+    RGBA PNG, which the whole-image path still handles.
+    """
+    if f.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+        raise ValueError("Strip mode needs a PNG or BMP carrier!")
+    header = f.read(8 + struct.calcsize(IHDR_FORMAT))
+    if len(header) < 8 + struct.calcsize(IHDR_FORMAT):
+        raise ValueError("PNG header is corrupt!")
+    length, chunk_type = struct.unpack_from('>I4s', header)
+    if chunk_type != b'IHDR' or length != struct.calcsize(IHDR_FORMAT):
+        raise ValueError("PNG header is corrupt!")
+    width, height, depth, color_type, _, _, interlace = struct.unpack_from(IHDR_FORMAT, header, 8)
+    f.read(4)  # CRC
+    if depth != 8 or interlace or color_type not in MODES:
+        raise ValueError("Strip mode needs a non-interlaced 8-bit grayscale, RGB or RGBA PNG!")
+    return (width, height), MODES[color_type]
+
+def iter_idat(f):
+    """Yield the contents of the IDAT chunks of a PNG in pieces of at most READ_SIZE bytes."""
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            raise ValueError("PNG ends before its IEND chunk!")
+        length, chunk_type = struct.unpack('>I4s', header)
+        if chunk_type == b'IEND':
+            return
+        if chunk_type != b'IDAT':
+            f.seek(length + 4, io.SEEK_CUR)  # Ancillary chunk and its CRC
+            continue
+        while length:
+            piece = f.read(min(length, READ_SIZE))
+            if not piece:
+                raise ValueError("PNG ends inside an IDAT chunk!")
+            length -= len(piece)
+            yield piece
+        f.read(4)  # CRC
+
+def iter_inflated(pieces):
+    """Inflate a zlib stream given in pieces, never producing more than READ_SIZE bytes at once."""
+    inflater = zlib.decompressobj()
+    try:
+        for piece in pieces:
+            while piece:
+                yield inflater.decompress(piece, READ_SIZE)
+                piece = inflater.unconsumed_tail
+        yield inflater.flush()
+    except zlib.error:
+        raise ValueError("PNG image data is corrupt!") from None
+
+def decode_band(size, mode, scanlines, previous_row):
+    """Undo the filters of a band of scanlines, returning the band as an Image.
+
+    previous_row holds the unfiltered bytes of the row above the band, or
+    is None for the first band.
+    """
+    width, rows = size
+    if previous_row is not None:
+        scanlines = bytes((FILTER_NONE,)) + previous_row + scanlines
+        rows += 1
+    band = (png_header((width, rows), mode) + chunk(b'IDAT', zlib.compress(scanlines, 0))
+            + chunk(b'IEND', b''))
+    try:
+        image = Image.open(io.BytesIO(band))
+        image.load()
+    except (zlib.error, OSError):  # A bad filter type in the scanlines
+        raise ValueError("PNG image data is corrupt!") from None
+    if previous_row is not None:
+        image = image.crop((0, 1, width, rows))
+    return image
+
+def iter_png_strips(f, size, mode, rows, grow=False):
+    """Yield (top, band) for the PNG in f, whose header has been read, `rows` rows at a time.
+
+    With grow, rows doubles after every band. The stream is only inflated
+    as far as the bands taken, so a reader that stops early skips the rest.
+    """
+    width, height = size
+    row_bytes = width * len(mode)
+    scanline = row_bytes + 1
+    buffer = bytearray()
+    previous_row = None
+    top = 0
+    for data in iter_inflated(iter_idat(f)):
+        buffer += data
+        while top < height and len(buffer) >= min(rows, height - top) * scanline:
+            count = min(rows, height - top)
+            band = decode_band((width, count), mode, bytes(buffer[:count * scanline]), previous_row)
+            del buffer[:count * scanline]
+            yield top, band
+            previous_row = band.crop((0, count - 1, width, count)).tobytes()
+            top += count
+            if grow:
+                rows *= 2
+    if top < height:
+        raise ValueError("PNG image data is truncated!")
+
+def read_strips(f, rows, grow=False):
+    """Read the header of the PNG in f, returning ((width, height), mode, strips).
+
+    strips yields (top, band) as iter_png_strips does.
+    """
+    size, mode = read_header(f)
+    return size, mode, iter_png_strips(f, size, mode, rows, grow)
+
+def filter_band(band, previous_band):
+    """Return the scanlines of band filtered with Up, each prefixed with its filter byte."""
+    width, rows = band.size
+    above = Image.new(band.mode, band.size)  # The row above the first one is zero for the first band
+    if previous_band is not None:
+        above.paste(previous_band.crop((0, previous_band.height - 1, width, previous_band.height)), (0, 0))
+    if rows > 1:
+        above.paste(band.crop((0, 0, width, rows - 1)), (0, 1))
+    filtered = ImageChops.subtract_modulo(band, above).tobytes()
+
+    row_bytes = width * len(band.mode)
+    scanlines = bytearray(rows * (row_bytes + 1))
+    scanlines[::row_bytes + 1] = bytes((FILTER_UP,)) * rows
+    for row in range(rows):
+        start = row * (row_bytes + 1) + 1
+        scanlines[start:start + row_bytes] = filtered[row * row_bytes:(row + 1) * row_bytes]
+    return scanlines
+
+def write_png_strips(f, size, mode, bands):
+    """Write the bands, in order and together covering size, to f as a PNG."""
+    f.write(png_header(size, mode))
+    deflater = zlib.compressobj(6)
+    pending = bytearray()
+    previous_band = None
+    for band in bands:
+        pending += deflater.compress(filter_band(band, previous_band))
+        previous_band = band
+        if len(pending) >= IDAT_SIZE:
+            f.write(chunk(b'IDAT', bytes(pending)))
+            pending.clear()
+    pending += deflater.flush()
+    f.write(chunk(b'IDAT', bytes(pending)))
+    f.write(chunk(b'IEND', b''))
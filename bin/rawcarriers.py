@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# Where the pixel or sample bytes of uncompressed carrier files live, so the
+# raw-byte LSB tool can leave headers alone.
+#
+# A carrier's Region is `count` bytes starting at `offset`, `step` bytes
+# apart. Only the low byte of each sample is used, so a 16-bit sample
+# changes by at most one step and headers, palettes and chunk tables are
+# never touched. Only the headers are read to find the region.
+
+import struct
+from collections import namedtuple
+
+Region = namedtuple('Region', 'offset count step')
+
+HEADER_SIZE = 4096  # Bytes read to find a carrier's format and, for PNM, its header
+
+# Signatures of compressed formats, whose bytes cannot take LSB changes
+COMPRESSED_SIGNATURES = {
+    b'\x89PNG\r\n\x1a\n': 'PNG',
+    b'\xff\xd8\xff': 'JPEG',
+    b'GIF87a': 'GIF',
+    b'GIF89a': 'GIF',
+    b'PK\x03\x04': 'ZIP',
+    b'\x1f\x8b': 'gzip',
+}
+
+# BMP headers, shared with bmpstrips so this module needs nothing beyond the standard library
+FILE_HEADER_FORMAT = '<2sIHHI'
+INFO_HEADER_FORMAT = '<IiiHHI'  # Header size, width, height, planes, bits per pixel, compression
+BI_RGB = 0
+BI_BITFIELDS = 3
+WAVE_FORMATS = {1: 'PCM', 3: 'float', 0xFFFE: 'extensible'}
+PNM_WHITESPACE = b' \t\r\n'
+
+def region_slice(region, start, stop):
+    """Return the slice of the file bytes holding carrier bytes start to stop of a region."""
+    return slice(region.offset + start * region.step, region.offset + stop * region.step, region.step)
+
+def bmp_region(f, size):
+    """Return the Region of the pixel rows of an uncompressed BMP."""
+    header = f.read(struct.calcsize(FILE_HEADER_FORMAT) + struct.calcsize(INFO_HEADER_FORMAT))
+    if len(header) < struct.calcsize(FILE_HEADER_FORMAT) + struct.calcsize(INFO_HEADER_FORMAT):
+        raise ValueError("BMP header is corrupt!")
+    _, _, _, _, offset = struct.unpack_from(FILE_HEADER_FORMAT, header)
+    _, width, height, _, depth, compression = struct.unpack_from(
+        INFO_HEADER_FORMAT, header, struct.calcsize(FILE_HEADER_FORMAT))
+    if compression not in (BI_RGB, BI_BITFIELDS):
+        raise ValueError("Compressed BMP carriers are not supported!")
+    stride = (width * depth + 31) // 32 * 4  # Rows are padded to 4 bytes
+    return Region(offset, max(0, min(stride * abs(height), size - offset)), 1)
+
+def pnm_region(f, size):
+    """Return the Region of the samples of a binary PGM (P5) or PPM (P6) file."""
+    header = f.read(HEADER_SIZE)
+    fields = []
+    pos = 2
+    while len(fields) < 3:
+        while pos < len(header) and header[pos] in PNM_WHITESPACE:
+            pos += 1
+        if header[pos:pos + 1] == b'#':  # Comment up to the end of the line
+            pos = header.find(b'\n', pos)
+            if pos < 0:
+                raise ValueError("PNM header is corrupt!")
+            continue
+        end = pos
+        while end < len(header) and header[end:end + 1].isdigit():
+            end += 1
+        if end == pos:
+            raise ValueError("PNM header is corrupt!")
+        fields.append(int(header[pos:end]))
+        pos = end
+    width, height, maxval = fields
+    offset = pos + 1  # A single whitespace character ends the header
+    channels = 3 if header[:2] == b'P6' else 1
+    sample_size = 1 if maxval < 256 else 2
+    # 16-bit samples are big-endian, so their low byte comes second
+    count = min(width * height * channels, (size - offset) // sample_size)
+    return Region(offset + sample_size - 1, max(0, count), sample_size)
+
+def wav_region(f, size):
+    """Return the Region of the samples of a PCM or float WAV file."""
+    f.seek(12)
+    sample_size = None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            raise ValueError("WAV file has no data chunk!")
+        chunk_id, length = struct.unpack('<4sI', header)
+        if chunk_id == b'fmt ':
+            fmt = f.read(length)
+            if len(fmt) < 16:
+                raise ValueError("WAV header is corrupt!")
+            format_tag, _, _, _, _, bits = struct.unpack_from('<HHIIHH', fmt)
+            if format_tag not in WAVE_FORMATS:
+                raise ValueError("Compressed WAV carriers are not supported!")
+            sample_size = (bits + 7) // 8
+            f.seek(length % 2, 1)  # Chunks are padded to an even length
+        elif chunk_id == b'data':
+            if sample_size is None:
+                raise ValueError("WAV data chunk comes before its format!")
+            offset = f.tell()
+            # Samples are little-endian, so their low byte comes first
+            return Region(offset, min(length, size - offset) // sample_size, sample_size)
+        else:
+            f.seek(length + length % 2, 1)
+
+def find_region(f, size, carrier='auto'):
+    """Return the Region of the file f, of the given size, that may carry hidden bits.
+
+    carrier 'raw' uses every byte from offset 0, as earlier versions did.
+    'auto' finds the pixel or sample bytes of BMP, PGM/PPM and WAV files,
+    rejects compressed formats, and treats anything else as raw.
+    """
+    if carrier == 'raw':
+        return Region(0, size, 1)
+    head = f.read(16)
+    f.seek(0)
+    for signature, name in COMPRESSED_SIGNATURES.items():
+        if head.startswith(signature):
+            raise ValueError(f"This looks like a {name} file, which is compressed; hiding in its bytes would "
+                             f"corrupt it. Use custom_7th.py for images, or --carrier raw to hide anyway.")
+    if head[:2] == b'BM':
+        return bmp_region(f, size)
+    if head[:2] in (b'P5', b'P6') and head[2:3] in PNM_WHITESPACE:
+        return pnm_region(f, size)
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return wav_region(f, size)
+    return Region(0, size, 1)
@@ -3,6 +3,20 @@
 # Custom steganography: Hiding text in the LSB of an image
 # Only uses built-in Python libraries
 
+import argparse
+import mmap
+import os
+import shutil
+import sys
+from functools import partial
+
+import batch
+import bitbuffer
+import payload
+import rawcarriers
+
+CHUNK_SIZE = 64 * 1024  # Carrier bytes decoded per step when reading a framed payload
+
 # Function to read an image as raw binary data
 
 def read_image(file_path):
@@ -14,74 +28,219 @@ def write_image(file_path, data):
     with open(file_path, "wb") as f:
         f.write(data)
 
-# Function to hide a message in the LSB of the image
-def hide_message(image_data, message):
-    message += "\0"  # Null terminator to mark end of the message
-    binary_message = ''.join(f"{ord(c):08b}" for c in message)  # Convert message to binary
-
-    if len(binary_message) > len(image_data):
-        raise ValueError("Message is too large to hide in this image!")
-
-    for i, bit in enumerate(binary_message):
-        image_data[i] = (image_data[i] & ~1) | int(bit)  # Set the LSB to the message bit
+# Function to get the Region covering every byte of in-memory image data
+def whole_region(image_data):
+    return rawcarriers.Region(0, len(image_data), 1)
 
+# Function to set the LSBs of the first carrier bytes of a region to the bits of a BitBuffer
+def embed_binary(image_data, bits, region, too_large):
+    if bits.length > region.count:
+        raise ValueError(too_large)
+    carrier = rawcarriers.region_slice(region, 0, bits.length)
+    image_data[carrier] = payload.embed_bits(image_data[carrier], bitbuffer.unpack(bits))  # Set every LSB at once
     return image_data
 
-# Function to extract a hidden message from the LSB of the image
-def extract_message(image_data):
-    binary_message = []
-
-    for byte in image_data:
-        binary_message.append(str(byte & 1))  # Get the LSB
+# Function to convert a message to a BitBuffer, null-terminated
+def message_to_binary(message):
+    message += "\0"  # Null terminator to mark end of the message
+    return bitbuffer.from_text(message)
 
-        # Check for null terminator every 8 bits
-        if len(binary_message) % 8 == 0 and ''.join(binary_message[-8:]) == "00000000":
+# Function to hide a message in the LSB of the image
+def hide_message(image_data, message, region=None):
+    return embed_binary(image_data, message_to_binary(message), region or whole_region(image_data),
+                        "Message is too large to hide in this image!")
+
+# Function to yield the hidden bytes of the image, one chunk of carrier bytes at a time
+def iter_hidden_bytes(image_data, region=None):
+    region = region or whole_region(image_data)
+    usable = region.count // 8 * 8
+    for start in range(0, usable, CHUNK_SIZE):
+        chunk = image_data[rawcarriers.region_slice(region, start, min(start + CHUNK_SIZE, usable))]
+        yield bitbuffer.to_bytes(bitbuffer.pack(chunk))
+
+# Function to yield the hidden bytes of an open carrier file, reading one chunk of carrier bytes at a time
+def iter_file_hidden_bytes(f, region):
+    usable = region.count // 8 * 8
+    f.seek(region.offset)
+    for start in range(0, usable, CHUNK_SIZE):
+        count = min(CHUNK_SIZE, usable - start)
+        # Read the whole stretch holding count carrier bytes, then keep every step-th byte
+        chunk = f.read((count - 1) * region.step + 1)
+        if len(chunk) < (count - 1) * region.step + 1:
+            raise ValueError("Carrier file is truncated!")
+        f.seek(region.step - 1, 1)  # Skip to the next carrier byte
+        yield bitbuffer.to_bytes(bitbuffer.pack(chunk[::region.step]))
+
+# Function to read a null-terminated message from chunks of hidden bytes, stopping at the terminator
+def decode_message(hidden):
+    message = bytearray()
+    for data in hidden:
+        end = data.find(0)  # Stop at the null terminator
+        if end >= 0:
+            message += data[:end]
             break
+        message += data
+    return message.decode('latin-1')
+
+# Function to read a framed payload from chunks of hidden bytes, stopping after its declared length
+def decode_payload(hidden):
+    return payload.read_payload(payload.byte_reader(hidden))
+
+# Function to decode chunks of hidden bytes in an extract format, returning (data, text_format); auto reads
+# a framed payload when the magic is there and a null-terminated message otherwise
+def decode_format(hidden, fmt='auto'):
+    if fmt == 'auto':
+        framed, hidden = payload.peek_framed(hidden)
+        fmt = 'framed' if framed else 'text'
+    if fmt == 'text':
+        return decode_message(hidden).encode('latin-1'), True
+    return decode_payload(hidden), False
 
-    # Convert binary to text
-    message = ''.join(
-        chr(int(''.join(binary_message[i:i+8]), 2))
-        for i in range(0, len(binary_message) - 8, 8)
-    )
-
-    return message
+# Function to extract a hidden message from the LSB of the image
+def extract_message(image_data, region=None):
+    return decode_message(iter_hidden_bytes(image_data, region))
+
+# Function to hide arbitrary bytes as a framed payload in the LSB of the image
+def hide_payload(image_data, data, region=None):
+    return embed_binary(image_data, bitbuffer.from_bytes(payload.frame_payload(data)),
+                        region or whole_region(image_data), "Payload is too large to hide in this image!")
+
+# Function to extract a framed payload, decoding only the bytes it covers
+def extract_payload(image_data, region=None):
+    return decode_payload(iter_hidden_bytes(image_data, region))
+
+# Function to find the carrier bytes of a file from its header
+def file_region(path, carrier='auto'):
+    with open(path, 'rb') as f:
+        return rawcarriers.find_region(f, os.fstat(f.fileno()).st_size, carrier)
+
+# Function to hide a message (str) or framed payload (bytes) in a file, editing only the carrier bytes used
+def hide_in_file(input_path, output_path, data, carrier='auto'):
+    region = file_region(input_path, carrier)
+    if isinstance(data, str):
+        bits, too_large = message_to_binary(data), "Message is too large to hide in this image!"
+    else:
+        bits = bitbuffer.from_bytes(payload.frame_payload(data))
+        too_large = "Payload is too large to hide in this image!"
+    if bits.length > region.count:
+        raise ValueError(too_large)  # Before anything is copied
+
+    if not (os.path.exists(output_path) and os.path.samefile(input_path, output_path)):
+        shutil.copyfile(input_path, output_path)  # Copied by the kernel where possible
+    with open(output_path, 'r+b') as f, mmap.mmap(f.fileno(), 0) as mm:
+        # Only the pages holding the carrier bytes used are read and written
+        embed_binary(mm, bits, region, too_large)
+
+# Function to run decode (decode_message or decode_payload) on a file, reading it in chunks
+def extract_from_file(path, decode, carrier='auto'):
+    with open(path, 'rb') as f:
+        region = rawcarriers.find_region(f, os.fstat(f.fileno()).st_size, carrier)
+        if region.count == 0:
+            raise ValueError("No hidden payload found in this carrier!")
+        # Only the chunks before the terminator or the declared length are read
+        return decode(iter_file_hidden_bytes(f, region))
+
+# Function to get the framed payload room of a carrier file, reading only its header
+def file_capacity(path, carrier='auto'):
+    return payload.max_payload(file_region(path, carrier).count // 8)
+
+# Batch task: hide data (a str message or framed bytes) in one carrier
+def batch_hide(path, timings, output_dir, data, carrier='auto'):
+    output = batch.output_path(output_dir, path, '')  # Same format, so the same name
+    with batch.phase(timings, 'embed'):
+        hide_in_file(path, output, data, carrier)
+    return {'output': output}
+
+# Batch task: extract the message or payload of one carrier
+def batch_extract(path, timings, output_dir, fmt, carrier='auto'):
+    with batch.phase(timings, 'extract'):
+        data, text_format = extract_from_file(path, partial(decode_format, fmt=fmt), carrier)
+    return batch.extraction_report(path, data, text_format, output_dir, timings)
 
 # Main program
 if __name__ == "__main__":
-    import sys
-
-    if len(sys.argv) < 4:
-        print("Usage: solver.py <hide/extract> <input_file> <output_file/message>")
-        sys.exit(1)
-
-    action, input_file = sys.argv[1], sys.argv[2]
-
-    if action == "hide":
-        if len(sys.argv) != 5:
-            print("Usage: solver.py hide <input_file> <output_file> <message>")
-            sys.exit(1)
-
-        output_file, message = sys.argv[3], sys.argv[4]
-
-        # Read image data
-        image_data = read_image(input_file)
-
-        # Hide message
-        try:
-            modified_data = hide_message(image_data, message)
-            write_image(output_file, modified_data)
-            print(f"Message hidden successfully in {output_file}.")
-        except ValueError as e:
-            print(f"Error: {e}")
-
-    elif action == "extract":
-        # Read image data
-        image_data = read_image(input_file)
-
-        # Extract message
-        message = extract_message(image_data)
-        print(f"Extracted message: {message}")
-
-    else:
-        print("Invalid action. Use 'hide' or 'extract'.")
+    parser = argparse.ArgumentParser(description="Raw-byte LSB Steganography Tool")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # Option shared by every subcommand: which bytes of the file carry the bits
+    carrier_parser = argparse.ArgumentParser(add_help=False)
+    carrier_parser.add_argument("--carrier", choices=["auto", "raw"], default="auto",
+                                help="auto: only the pixel or sample bytes of BMP, PGM/PPM and WAV files, "
+                                     "every byte of other uncompressed files (default); raw: every byte "
+                                     "from the start of the file, as earlier versions did")
+
+    # Subparser for hiding a message
+    hide_parser = subparsers.add_parser("hide", parents=[carrier_parser], help="Hide a message in the LSBs of a file")
+    hide_parser.add_argument("input", help="Path to the input file")
+    hide_parser.add_argument("output", help="Path to save the output file (the input path itself hides in place)")
+    hide_parser.add_argument("message", nargs="?", help="Message to hide")
+    hide_parser.add_argument("--file", help="Hide the contents of this file instead of a message")
+    hide_parser.add_argument("--format", choices=["framed", "text"], default="framed",
+                             help="framed: length-prefixed payload with a checksum (default); "
+                                  "text: null-terminated message as in earlier versions")
+
+    # Subparser for extracting a message
+    extract_parser = subparsers.add_parser("extract", parents=[carrier_parser],
+                                           help="Extract a message from the LSBs of a file")
+    extract_parser.add_argument("input", help="Path to the file to extract the message from")
+    extract_parser.add_argument("--format", choices=["auto", "framed", "text"], default="auto",
+                                help="Format the message was hidden with (default: auto, framed when the "
+                                     "carrier holds a framed payload and text otherwise)")
+    extract_parser.add_argument("--output", help="Write the extracted payload to this file")
+
+    # Subparser for running hide or extract over many files
+    batch_parser = subparsers.add_parser("batch", parents=[carrier_parser],
+                                         help="Hide or extract in every file of a directory or manifest, "
+                                              "printing one JSON line per file")
+    batch.add_batch_arguments(batch_parser)
+
+    # Subparser for sizing carriers without reading them
+    capacity_parser = subparsers.add_parser("capacity", parents=[carrier_parser],
+                                            help="Report how many payload bytes each file holds")
+    capacity_parser.add_argument("carriers", nargs="+", help="Files, or directories of files")
+
+    args = parser.parse_args()
+
+    if args.command == "capacity":
+        sys.exit(1 if batch.report_capacities(args.carriers, partial(file_capacity, carrier=args.carrier)) else 0)
+
+    if args.command == "batch":
+        data = batch.prepare_batch(parser, args)
+        if args.action == "hide":
+            task = partial(batch_hide, output_dir=args.output_dir, data=data, carrier=args.carrier)
+        else:
+            task = partial(batch_extract, output_dir=args.output_dir, fmt=args.format, carrier=args.carrier)
+        sys.exit(1 if batch.run_batch(task, args.source, args.jobs, args.output_dir) else 0)
+
+    if args.command == "hide" and (args.message is None) == (args.file is None):
+        parser.error("hide needs either a message or --file")
+    if args.command == "hide" and args.format == "text" and args.file is not None:
+        parser.error("--file needs the framed format")
+
+    try:
+        if args.command == "hide":
+            # Hide message
+            if args.format == "text":
+                data = args.message
+            elif args.file is not None:
+                with open(args.file, 'rb') as f:
+                    data = f.read()
+            else:
+                data = args.message.encode('utf-8')
+            hide_in_file(args.input, args.output, data, args.carrier)
+            print(f"Message hidden successfully in {args.output}.")
+
+        elif args.command == "extract":
+            # Extract message
+            data, text_format = extract_from_file(args.input, partial(decode_format, fmt=args.format),
+                                                  args.carrier)
+            message = data.decode('latin-1') if text_format else data.decode('utf-8', errors='replace')
+            if args.output:
+                with open(args.output, 'wb') as f:
+                    f.write(data)
+                print(f"Extracted {len(data)} bytes to {args.output}")
+            else:
+                print(f"Extracted message: {message}")
+    except ValueError as e:
+        print(f"Error: {e}")
         sys.exit(1)